@@ -1,10 +1,28 @@
-import configparser
+import collections
+import concurrent.futures
+import hashlib
+import json
 import os
 import os.path as osp
+import re
+import subprocess
 import tarfile
+import tempfile
+import threading
+import time
+import urllib.parse
+import zlib
 
 import requests
-import yaml
+
+from .cache import UMASK, ManifestCache, MetadataCache, TarballCache, copy_file, default_cache_dir, write_if_changed
+from .dcf import parse_dcf, parse_dcf_record
+from .index import MmapPackagesIndex, PackagesIndex
+from .license import classify_license
+from .mirrors import MirrorGroup, MirrorPool
+from .profiler import Profiler
+from .tarball import StreamReader, inspect_tarball
+from .yaml_writer import dump_yaml
 
 
 class PKGBUILDGenerator(object):
@@ -14,53 +32,94 @@ class PKGBUILDGenerator(object):
         bioconductor_mirror="https://bioconductor.org",
         cran_packages_file=None,
         bioconductor_packages_file1=None,
-        bioconductor_packages_file2=None
+        bioconductor_packages_file2=None,
+        cache_dir=None,
+        cache_ttl=0,
+        offline=False,
+        max_connections_per_host=4,
+        tarball_cache_size=2 * 1024 ** 3,
+        profiler=None,
+        session=None,
+        hedge_delay=1.0,
+        github_api="https://api.github.com",
+        github_token=None
     ):
         """PKGBUILDGenerator class
-        param: cran_mirror, CRAN mirror
-        param: bioconductor_mirror, Bioconductor mirror
+        param: cran_mirror, CRAN mirror, or a list of them, the fastest healthy one is used, see MirrorPool
+        param: bioconductor_mirror, Bioconductor mirror, or a list of them
         param: cran_packages_file, pre-downloaded PACKAGES file from https://cran.r-project.org/src/contrib/PACKAGES
         param: bioconductor_packages_file1, pre-downloaded PACKAGES file from https://bioconductor.org/packages/release/bioc/src/contrib/PACKAGES
         param: bioconductor_packages_file1, pre-downloaded PACKAGES file from https://bioconductor.org/packages/release/data/annotation/src/contrib/PACKAGES
+        param: cache_dir, cache dir for PACKAGES files fetched from mirrors, default: $XDG_CACHE_HOME/pkgbuild-generator-for-r
+        param: cache_ttl, seconds a cached PACKAGES file is used without revalidating it against the mirror
+        param: offline, never touch the network for PACKAGES files, use the cached ones only
+        param: max_connections_per_host, max number of concurrent downloads from one host
+        param: tarball_cache_size, max total size of source tarballs cached in `cache_dir` in bytes, 0 to disable the cache
+        param: profiler, Profiler recording per-stage timers and byte counters, default: none are recorded
+        param: session, requests.Session used for all HTTP requests, e.g. with custom headers or proxies, default: a new one
+        param: hedge_delay, seconds to wait for a mirror before racing the next one, if there are several
+        param: github_api, base url of the github API, e.g. of a GitHub Enterprise server
+        param: github_token, github token, lifts the rate limit of 60 anonymous requests per hour
         """
-        self.cran_mirror = cran_mirror
-        self.bioconductor_mirror = bioconductor_mirror
+        cran_mirrors = [cran_mirror] if isinstance(cran_mirror, str) else list(cran_mirror)
+        bioconductor_mirrors = [bioconductor_mirror] if isinstance(bioconductor_mirror, str) else list(bioconductor_mirror)
+        # urls are built from the first mirror, the mirror pool sends them to the best one
+        self.cran_mirror = cran_mirrors[0].rstrip('/')
+        self.bioconductor_mirror = bioconductor_mirrors[0].rstrip('/')
         self.repos = ["cran", "bioconductor", "github"]
-        # cache all pkg metadata in CRAN
-        if cran_packages_file:
-            with open(cran_packages_file, 'r') as f:
-                self.cran_descs = f.read().split('\n\n')
-        else:
-            r_cran = requests.get(
-                f"{cran_mirror}/src/contrib/PACKAGES")
-            if r_cran.status_code == requests.codes.ok:
-                self.cran_descs = r_cran.text.split('\n\n')
-            else:
-                raise RuntimeError(
-                    f"Failed to get CRAN descriptions due to: {r_cran.status_code}: {r_cran.reason}")
-        # cache all pkg metadata in Bioconductor
+        # one session for all requests, so connections to a mirror are reused across pkgs
+        if session is None:
+            session = requests.Session()
+            # keep as many connections per host as may be used at once
+            adapter = requests.adapters.HTTPAdapter(
+                pool_maxsize=max(max_connections_per_host, 10))
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+        self.mirror_pool = MirrorPool(self.session, [
+            MirrorGroup(cran_mirrors, "src/contrib/PACKAGES"),
+            MirrorGroup(bioconductor_mirrors, "packages/release/bioc/src/contrib/PACKAGES")
+        ], hedge_delay=hedge_delay, semaphore=self.host_semaphore)
+        self.metadata_cache = MetadataCache(
+            cache_dir=cache_dir, ttl=cache_ttl, offline=offline, session=self.mirror_pool)
+        self.tarball_cache = TarballCache(
+            cache_dir=cache_dir, max_size=tarball_cache_size)
+        self.manifest_cache = ManifestCache(cache_dir=cache_dir)
+        self.github_api = github_api.rstrip('/')
+        self.github_token = github_token
+        # PACKAGES indexes of CRAN and the Bioconductor sub-repos, loaded on first lookup by get_index
+        self.bioconductor_repos = ["bioc", "annotation", "experiment"]
+        self.packages_urls = {
+            "cran": f"{self.cran_mirror}/src/contrib/PACKAGES",
+            "bioc": f"{self.bioconductor_mirror}/packages/release/bioc/src/contrib/PACKAGES",
+            "annotation": f"{self.bioconductor_mirror}/packages/release/data/annotation/src/contrib/PACKAGES",
+            "experiment": f"{self.bioconductor_mirror}/packages/release/data/experiment/src/contrib/PACKAGES"
+        }
+        self.packages_files = {"cran": cran_packages_file}
+        # sidecars of the offset indexes of pre-downloaded PACKAGES files, see MmapPackagesIndex
+        self.index_cache_dir = osp.join(cache_dir or default_cache_dir(), "index")
         if bioconductor_packages_file1 and bioconductor_packages_file2:
-            with open(bioconductor_packages_file1, 'r') as f1, open(bioconductor_packages_file2, 'r') as f2:
-                self.bioconductor_descs = [
-                    f1.read().split('\n\n'),
-                    f2.read().split('\n\n')
-                ]
-        else:
-            bioconductor_descs = []
-            for url in [f"{self.bioconductor_mirror}/packages/release/bioc/src/contrib/PACKAGES",
-                        f"{self.bioconductor_mirror}/packages/release/data/annotation/src/contrib/PACKAGES",
-                        f"{self.bioconductor_mirror}/packages/release/data/experiment/src/contrib/PACKAGES"
-                        ]:
-                r = requests.get(url)
-                if r.status_code == requests.codes.ok:
-                    bioconductor_descs.append(r.text.split('\n\n'))
-                else:
-                    bioconductor_descs.append([])
-            x = set([len(_) for _ in bioconductor_descs])
-            if len(x) == 1 and list(x)[0] == 0:
-                raise RuntimeError(
-                    f"Failed to get Bioconductor descriptions ")
-            self.bioconductor_descs = bioconductor_descs
+            self.packages_files["bioc"] = bioconductor_packages_file1
+            self.packages_files["annotation"] = bioconductor_packages_file2
+            # there is no pre-downloaded PACKAGES file for experiment data
+            self.packages_urls["experiment"] = None
+        self.indexes = {}
+        self.index_errors = {}
+        self.index_lock = threading.Lock()
+        # limit concurrent downloads from one host when pkgs are generated in parallel
+        self.max_connections_per_host = max_connections_per_host
+        self.host_semaphores = {}
+        self.host_semaphores_lock = threading.Lock()
+        # rpkgname -> rpkgnames depending on it, built on first use by get_reverse_index
+        self.reverse_index = None
+        # bytes of source tarballs downloaded so far, for throughput reports
+        self.bytes_downloaded = 0
+        self.bytes_downloaded_lock = threading.Lock()
+        # generated files written and left alone as their content did not change, for the end-of-run summary
+        self.files_written = 0
+        self.files_unchanged = 0
+        self.files_written_lock = threading.Lock()
+        self.profiler = profiler or Profiler(enabled=False)
         self.exclude_pkgs = {
             "base",
             "boot",
@@ -124,51 +183,235 @@ class PKGBUILDGenerator(object):
             "W3C",
             "ZPL"
         ]
+        # makedepends of the compiled languages found in source tarballs, C and C++ need only base-devel
+        self.language_makedepends = {
+            "Fortran": "gcc-fortran",
+            "Rust": "cargo"
+        }
+
+    def get_index(self, repo):
+        """ get the PACKAGES index of `repo`, load it on first use
+        param: repo: "cran" or one of self.bioconductor_repos
+        return: PackagesIndex, empty if a Bioconductor sub-repo could not be loaded
+        raise: RuntimeError if CRAN could not be loaded
+        """
+        if repo in self.indexes:
+            return self.indexes[repo]
+        with self.index_lock:
+            if repo not in self.indexes:
+                self.indexes[repo] = self.load_index(repo)
+        return self.indexes[repo]
+
+    def load_index(self, repo):
+        """
+        load the PACKAGES index of `repo`, see get_index
+        """
+        index, error = self.fetch_index(repo)
+        if error is not None:
+            self.index_errors[repo] = error
+        return index
+
+    def fetch_index(self, repo):
+        """ load the PACKAGES index of `repo` without touching self.indexes
+        param: repo: "cran" or one of self.bioconductor_repos
+        return: (PackagesIndex, error), the index is empty if a Bioconductor sub-repo could not be loaded, error is None
+            if it could
+        raise: RuntimeError if CRAN could not be loaded
+        """
+        if self.packages_files.get(repo):
+            # pre-downloaded files are memory-mapped, entries are only parsed when looked up
+            filename = osp.abspath(self.packages_files[repo])
+            sidecar = osp.join(self.index_cache_dir, f"{hashlib.sha256(filename.encode('utf-8')).hexdigest()}.idx")
+            with self.profiler.span("index_mmap", repo=repo):
+                return MmapPackagesIndex(filename, sidecar=sidecar), None
+        text = ""
+        error = None
+        with self.profiler.span("index_download", repo=repo) as span:
+            try:
+                if self.packages_urls[repo]:
+                    text = self.metadata_cache.fetch_packages(
+                        self.packages_urls[repo])
+            except (RuntimeError, requests.RequestException) as e:
+                if repo == "cran":
+                    raise RuntimeError(
+                        f"Failed to get CRAN descriptions due to: {e}")
+                # a sub-repo that failed to load is treated as empty, so one broken mirror path does not stop the run
+                error = e
+            span["bytes"] = len(text)
+        with self.profiler.span("index_parse", repo=repo):
+            return PackagesIndex(parse_dcf(text)), error
+
+    def refresh_indexes(self):
+        """ reload the PACKAGES indexes loaded so far, e.g. in a long-running process, lookups keep using the old index of
+        a repo until its new one is loaded, cached PACKAGES files that did not change are not fetched again
+        raise: RuntimeError if some repos could not be reloaded, they keep their old index, the others are reloaded
+        """
+        with self.index_lock:
+            repos = list(self.indexes)
+        errors = {}
+        for repo in repos:
+            # fetched outside the lock, so lookups and first loads of other repos are not blocked meanwhile
+            try:
+                index, error = self.fetch_index(repo)
+            except RuntimeError as e:
+                index, error = None, e
+            if error is not None:
+                errors[repo] = error
+                continue
+            with self.index_lock:
+                self.indexes[repo] = index
+                self.index_errors.pop(repo, None)
+                self.reverse_index = None
+        if errors:
+            raise RuntimeError(
+                f"Failed to reload PACKAGES indexes of {', '.join(errors)}: {[str(_) for _ in errors.values()]}")
+
+    def host_semaphore(self, url):
+        """
+        return the semaphore limiting concurrent requests to the host of `url`
+        """
+        host = urllib.parse.urlsplit(url).netloc
+        with self.host_semaphores_lock:
+            if host not in self.host_semaphores:
+                self.host_semaphores[host] = threading.BoundedSemaphore(
+                    self.max_connections_per_host)
+            return self.host_semaphores[host]
+
+    def list_packages(self, repos=None, regex=None):
+        """ list pkgs in the PACKAGES indexes
+        args:
+            repos: repos to list, "cran" and/or "bioconductor", default: both
+            regex: only list pkgs whose name matches this regex
+        return: list of (rpkgname, repo) sorted by repo then rpkgname, a pkg in both CRAN and Bioconductor is listed for CRAN only
+        """
+        if repos is None:
+            repos = ["cran", "bioconductor"]
+        pattern = re.compile(regex) if regex else None
+        packages = []
+        seen = set()
+        for repo in ["cran", "bioconductor"]:
+            names = set()
+            for index_repo in (["cran"] if repo == "cran" else self.bioconductor_repos):
+                names.update(self.get_index(index_repo))
+            if repo in repos:
+                for name in sorted(names - seen):
+                    if pattern is None or pattern.search(name):
+                        packages.append((name, repo))
+            seen.update(names)
+        return packages
 
-    def has_fortran_src(self, tarfile_object):
+    def classify_licenses(self, repos=None, regex=None):
+        """ classify licenses of all pkgs in the PACKAGES indexes in one pass, no tarball is fetched
+        args: see list_packages
+        return: rpkgname -> (license in PKGBUILD, license file to install or None)
         """
-        return True if Fortran src file is found in the source tarball
+        licenses = {}
+        for rpkgname, repo in self.list_packages(repos=repos, regex=regex):
+            record = self.find_record(rpkgname, repo)
+            licenses[rpkgname] = classify_license(record.get("License", ""))
+        return licenses
+
+    def find_record(self, rpkgname, repo="cran"):
+        """ get the PackageRecord of `rpkgname` from the PACKAGES index of `repo`
+        param: rpkgname: pkg name in R, case sensitive
+        param: repo: "cran" or "bioconductor"
+        return: PackageRecord, None if not found
         """
-        for name in tarfile_object.getnames():
-            if name.endswith(".f") or name.endswith(".f90") or name.endswith(".for"):
-                return True
-        return False
+        for index_repo in (["cran"] if repo == "cran" else self.bioconductor_repos):
+            record = self.get_index(index_repo).get(rpkgname)
+            if record is not None:
+                return record
+        return None
 
-    def get_bioconductor_ver(self, bio_name, return_idx=False):
+    def get_bioconductor_ver(self, bio_name, return_idx=False, ignore_case=False):
         """ get pkg version from Bioconductor
         args:
-            bio_name: pkg name in Bioconductor, case sensitive
-            return_idx: return idx of self.bio_descs
+            bio_name: pkg name in Bioconductor, case sensitive unless `ignore_case`
+            return_idx: return idx of self.bioconductor_repos
+            ignore_case: look up `bio_name` case-insensitively
         return: pkg version in Bioconductor
         raise: RuntimeError if not found
         """
-        config = configparser.ConfigParser()
-        for idx, descs in enumerate(self.bioconductor_descs):
-            for _ in descs:
-                if _.startswith(f"Package: {bio_name}\n"):
-                    config.read_string(f"[{bio_name}]\n" + _)
-                    if return_idx:
-                        return config[bio_name]["version"], idx
-                    else:
-                        return config[bio_name]["version"]
+        # sub-repos are loaded one by one, data sub-repos only if the pkg is not in an earlier one
+        for idx, bioconductor_repo in enumerate(self.bioconductor_repos):
+            record = self.get_index(bioconductor_repo).get(
+                bio_name, ignore_case=ignore_case)
+            if record is not None:
+                rpkgver = record.version
+                if return_idx:
+                    return rpkgver, idx
+                else:
+                    return rpkgver
 
+        loadable_repos = [_ for _ in self.bioconductor_repos
+                          if self.packages_files.get(_) or self.packages_urls[_]]
+        if all(_ in self.index_errors for _ in loadable_repos):
+            raise RuntimeError(
+                f"Failed to get Bioconductor descriptions due to: {[str(self.index_errors[_]) for _ in loadable_repos]}")
         raise RuntimeError(f"{bio_name} not found in Bioconductor")
 
-    def get_cran_ver(self, cran_name):
+    def get_cran_ver(self, cran_name, ignore_case=False):
         """ get pkg version from CRAN
-        param: cran_name: pkg name in CRAN, case sensitive
+        param: cran_name: pkg name in CRAN, case sensitive unless `ignore_case`
+        param: ignore_case: look up `cran_name` case-insensitively
         return: pkg version in CRAN
         raise: RuntimeError if not found
         """
-        config = configparser.ConfigParser()
-        for _ in self.cran_descs:
-            if _.startswith(f"Package: {cran_name}\n"):
-                config.read_string(f"[{cran_name}]\n" + _)
-                break
-        if cran_name not in config:
+        record = self.get_index("cran").get(cran_name, ignore_case=ignore_case)
+        if record is None:
             raise RuntimeError(f"{cran_name} not found in CRAN")
 
-        return config[cran_name]["version"]
+        return record.version
+
+    def get_rpkgname(self, name):
+        """ map `name` to the real pkg name in CRAN or Bioconductor
+        param: name: pkg name in any case, with or without the `r-` prefix of ArchLinux pkgname
+        return: pkg name in R, an exact match wins over a case-insensitive one, then CRAN wins over Bioconductor,
+            the name after `r-` is matched case-insensitively
+        raise: RuntimeError if not found
+        """
+        is_archlinux_name = name.lower().startswith("r-")
+        # (candidate, ignore_case, repos) in order of preference, ArchLinux pkgnames are lowercase, so the case of the
+        # name after `r-` tells nothing and CRAN is searched for it before any Bioconductor index is loaded
+        lookups = [(name, False, ["cran"])]
+        if is_archlinux_name:
+            lookups.append((name[2:], True, ["cran"]))
+        lookups += [(name, False, self.bioconductor_repos), (name, True, ["cran"] + self.bioconductor_repos)]
+        if is_archlinux_name:
+            lookups.append((name[2:], True, self.bioconductor_repos))
+        for candidate, ignore_case, repos in lookups:
+            for repo in repos:
+                index = self.get_index(repo)
+                if ignore_case:
+                    rpkgname = index.resolve_name(candidate)
+                else:
+                    rpkgname = candidate if candidate in index else None
+                if rpkgname is not None:
+                    return rpkgname
+
+        raise RuntimeError(f"{name} not found in CRAN or Bioconductor")
+
+    def get_github_release(self, github_owner, github_repo):
+        """ get the latest release of a github repo
+        the release is fetched through the metadata cache with a conditional request, a 304 does not count against the rate limit
+        param: github_owner: github repo owner
+        param: github_repo: github repo name
+        return: release object of the github API, see https://docs.github.com/en/rest/releases/releases#get-the-latest-release
+        raise: RuntimeError if the repo has no release, the request failed, or the release is not cached in offline mode
+        """
+        release_url = f"{self.github_api}/repos/{github_owner}/{github_repo}/releases/latest"
+        headers = {"Accept": "application/vnd.github+json"}
+        if self.github_token:
+            headers["Authorization"] = f"Bearer {self.github_token}"
+        # the request holds the semaphore of the github API host, see MirrorPool.send
+        with self.profiler.span("github_api", f"{github_owner}/{github_repo}"):
+            body = self.metadata_cache.fetch_bytes(release_url, headers=headers)
+        if body is None and self.metadata_cache.offline:
+            raise RuntimeError(f"{release_url} is not cached, can not fetch it in offline mode")
+        if body is None:
+            raise RuntimeError(
+                f"could not find version in https://github.com/{github_owner}/{github_repo}: no release found")
+        return json.loads(body)
 
     def get_github_ver(self, github_owner, github_repo):
         """get rpkgname version from github
@@ -181,32 +424,124 @@ class PKGBUILDGenerator(object):
         github_repo=vscDebugger
         """
         # currently, we only check for release, not git tags
-        release_url = f"https://api.github.com/repos/{github_owner}/{github_repo}/releases"
-        r = requests.get(release_url)
-        if r.status_code == requests.codes.ok:
-            if r.json():
-                return r.json()[0]["name"]
-        else:
-            raise RuntimeError(
-                f"could not find version in https://github.com/{github_owner}/{github_repo} due to {r.status_code}: {r.reason}")
+        release = self.get_github_release(github_owner, github_repo)
+        return release.get("name") or release["tag_name"]
+
+    def get_github_vers(self, github_repos, jobs=8):
+        """ get versions of several github repos, checking up to `jobs` repos in parallel
+        param: github_repos: list of (github_owner, github_repo)
+        return: (github_owner, github_repo) -> version or the exception raised while getting it
+        """
+        results = self.map_jobs(lambda _: self.get_github_ver(*_), github_repos, jobs)
+        return {repo: ver if error is None else error for repo, (ver, error) in zip(github_repos, results)}
 
-    def isInCran(self, cran_name):
+    def isInCran(self, cran_name, ignore_case=False):
         """
         return True if `cran_name` is found in CRAN
         """
-        for _ in self.cran_descs:
-            if _.startswith(f"Package: {cran_name}\n"):
-                return True
+        if ignore_case:
+            return self.get_index("cran").resolve_name(cran_name) is not None
+        return cran_name in self.get_index("cran")
+
+    def inspect_source(self, url, cache_repo, tarfilename, desc_filename, clean=True):
+        """ read DESCRIPTION of a source tarball, from the tarball cache if it's there, from `url` otherwise
+        args:
+            url: url of the source tarball
+            cache_repo: repo part of the tarball cache key, e.g. cran, bioc, github/owner
+            tarfilename: file name of the tarball, `{name}_{version}.tar.gz`
+            desc_filename: member name of the DESCRIPTION file
+            clean: do not keep a copy of the source tarball in cwd if True
+        return: (manifest of the tarball, see tarball.build_manifest, sha256 of the tarball)
+        """
+        cached = None
+        if self.tarball_cache.max_size:
+            cached = self.tarball_cache.lookup(cache_repo, tarfilename)
+        if cached is not None:
+            cached_filename, cached_sha256 = cached
+            # a tarball whose manifest is cached is only hashed, not decompressed
+            manifest = self.manifest_cache.lookup(cache_repo, tarfilename, cached_sha256)
+            manifest_cached = manifest is not None
+            try:
+                with open(cached_filename, "rb") as f, self.profiler.span("tarball_cache", tarball=tarfilename) as span:
+                    reader = StreamReader(f)
+                    if manifest is None:
+                        manifest = inspect_tarball(reader, desc_filename)
+                    reader.drain()
+                    span["bytes"] = reader.size
+            except (OSError, EOFError, tarfile.TarError, zlib.error, RuntimeError):
+                reader = None
+            if reader is not None and reader.sha256() == cached_sha256:
+                if not manifest_cached:
+                    self.manifest_cache.store(cache_repo, tarfilename, cached_sha256, manifest)
+                if not clean:
+                    copy_file(cached_filename, tarfilename)
+                return manifest, cached_sha256
+            # corrupted cache entry, fetch it again
+            self.tarball_cache.invalidate(cache_repo, tarfilename)
 
-        return False
+        # the tarball is inspected while it's streamed, it's never held in memory or extracted to disk
+        # the download holds the semaphore of the mirror it's sent to, see MirrorPool.send
+        with self.profiler.span("tarball", tarball=tarfilename) as span, \
+                self.mirror_pool.get(url, allow_redirects=True, stream=True) as r:
+            if r.status_code != requests.codes.ok:
+                raise RuntimeError(
+                    f"Failed to get source tarball {tarfilename} due to: {r.reason}")
+            r.raw.decode_content = True
+            tee = None
+            if self.tarball_cache.max_size:
+                tee = self.tarball_cache.writer(cache_repo, tarfilename)
+            elif not clean:
+                # keep a copy of the tarball in cwd, written under a temp name first
+                tee = tempfile.NamedTemporaryFile(
+                    dir='.', prefix=f".{tarfilename}.", delete=False)
+            try:
+                start = time.perf_counter()
+                reader = StreamReader(r.raw, tee)
+                manifest = inspect_tarball(reader, desc_filename)
+                # tarfile stops at the end-of-archive blocks, the checksum is of the whole file
+                reader.drain()
+                inspect_time = time.perf_counter() - start
+            except BaseException:
+                if tee is not None:
+                    tee.close()
+                    os.remove(tee.name)
+                raise
+            span["bytes"] = reader.size
+        # time spent waiting on the stream is download, the rest is decompressing and scanning members
+        self.profiler.add("tarball_download", reader.read_time, reader.size)
+        self.profiler.add("tar_scan", inspect_time - reader.read_time)
+        sha256 = reader.sha256()
+        with self.bytes_downloaded_lock:
+            self.bytes_downloaded += reader.size
+        if self.tarball_cache.max_size:
+            tee.close()
+            if not clean:
+                # copied before it's committed, as the cache may evict it right away or in another job
+                try:
+                    copy_file(tee.name, tarfilename)
+                except BaseException:
+                    os.remove(tee.name)
+                    raise
+            self.tarball_cache.commit(tee, cache_repo, tarfilename, sha256)
+        elif tee is not None:
+            tee.close()
+            os.chmod(tee.name, 0o666 & ~UMASK)
+            os.replace(tee.name, tarfilename)
+        if self.tarball_cache.max_size:
+            # the manifest cache is only looked up for a cached tarball, without one it would never be read
+            self.manifest_cache.store(cache_repo, tarfilename, sha256, manifest)
+        return manifest, sha256
 
-    def parse_description(self, rpkgname, repo="cran", clean=True):
+    def parse_description(self, rpkgname, repo="cran", clean=True, metadata_only=False):
         """
         parse DESCRIPTION file of `rpkgname`
         args:
             rpkgname: pkgname in R (CRAN, Bioconductor, Github), for github, rpkgname should be github_owner/github_repo
             repo: repo that pkgname is in, CRAN, Bioconductor, github
-            clean: delete files if True
+            clean: do not keep a copy of the source tarball in cwd if True
+            metadata_only: build the result from the PACKAGES index alone, without fetching the source tarball,
+                title, systemrequirements, makedepends, languages and sha256sum are then left empty until complete_description,
+                github pkgs have no index and are always parsed from the tarball
         """
         if repo not in self.repos:
             raise RuntimeError(f"Only these repos is supported: {self.repos}")
@@ -225,10 +560,16 @@ class PKGBUILDGenerator(object):
             "license": None,
             "license_filename": None,
             "source": None,
-            "project_url": None
+            "sha256sum": None,
+            "project_url": None,
+            "url": None,
+            "subrepo": None,
+            "languages": None,
+            "complete": False
         }
         if repo == "bioconductor":
             rpkgver, idx = self.get_bioconductor_ver(rpkgname, return_idx=True)
+            subrepo = self.bioconductor_repos[idx]
             if idx == 0:
                 url = f"{self.bioconductor_mirror}/packages/release/bioc/src/contrib/{rpkgname}_{rpkgver}.tar.gz"
                 source = "https://bioconductor.org/packages/release/bioc/src/contrib/${_pkgname}_${_pkgver}.tar.gz"
@@ -241,11 +582,13 @@ class PKGBUILDGenerator(object):
             result["project_url"] = 'https://bioconductor.org/packages/${_pkgname}'
         elif repo == "cran":
             rpkgver = self.get_cran_ver(rpkgname)
+            subrepo = "cran"
             url = f"{self.cran_mirror}/src/contrib/{rpkgname}_{rpkgver}.tar.gz"
             source = "https://cran.r-project.org/src/contrib/${_pkgname}_${_pkgver}.tar.gz"
             result["project_url"] = 'https://cran.r-project.org/package=${_pkgname}'
         elif repo == "github":
             github_owner, github_repo = rpkgname.strip('/').split('/')
+            subrepo = f"github/{github_owner}"
             result["rpkgname"] = github_repo
             result["github_owner"] = github_owner
             result["github_repo"] = github_repo
@@ -259,161 +602,106 @@ class PKGBUILDGenerator(object):
                 source = f"https://github.com/{github_owner}/{github_repo}/releases/download/${{pkgver}}/${{_pkgname}}_${{pkgver}}.tar.gz"
         result["source"] = source
         result["rpkgver"] = rpkgver
-        config = configparser.ConfigParser()
-        # meta db data in self.descs is not complete, still need to fetch desc for specific rpkgname
-        r = requests.get(url, allow_redirects=True)
-        if repo == "github":
-            tarfilename = f"{github_repo}_{rpkgver}.tar.gz"
-            desc_filename = f"{github_repo}/DESCRIPTION"
-        else:
-            tarfilename = f"{rpkgname}_{rpkgver}.tar.gz"
-            desc_filename = f"{rpkgname}/DESCRIPTION"
-        if r.status_code == requests.codes.ok:
-            with open(tarfilename, "wb") as f:
-                f.write(r.content)
-        else:
-            raise RuntimeError(
-                f"Failed to get source tarball {rpkgname}-{rpkgver}.tar.gz due to: {r.reason}")
-        with tarfile.open(tarfilename) as f:
-            f.extract(desc_filename)
-            if self.has_fortran_src(f):
-                result["makedepends"] = ["gcc-fortran"]
-        with open(desc_filename, "r") as f:
-            config.read_string(f"[{rpkgname}]\n" + f.read())
-        if clean:
-            os.remove(tarfilename)
-            os.remove(desc_filename)
-            os.removedirs(osp.dirname(desc_filename))
-        if "title" in config[rpkgname]:
-            result["title"] = config[rpkgname]["title"].replace(
+        result["url"] = url
+        result["subrepo"] = subrepo
+        if metadata_only and repo != "github":
+            self.apply_record(result, self.find_record(rpkgname, repo))
+            return result
+        return self.complete_description(result, clean)
+
+    def complete_description(self, desc_dict, clean=True):
+        """ fill a parse_description result from DESCRIPTION in the source tarball, it's a no-op for complete ones
+        args:
+            desc_dict: parse_description result, it's updated in place
+            clean: do not keep a copy of the source tarball in cwd if True
+        return: desc_dict
+        """
+        if desc_dict["complete"]:
+            return desc_dict
+        with self.profiler.span("complete_description", desc_dict["rpkgname"]):
+            # meta db data in PACKAGES index is not complete, still need to fetch desc for specific rpkgname
+            tarfilename = f"{desc_dict['rpkgname']}_{desc_dict['rpkgver']}.tar.gz"
+            desc_filename = f"{desc_dict['rpkgname']}/DESCRIPTION"
+            # the tarball is hashed while it's read, so PKGBUILD gets the real checksum without downloading it again
+            manifest, desc_dict["sha256sum"] = self.inspect_source(
+                desc_dict["url"], desc_dict["subrepo"], tarfilename, desc_filename, clean)
+            with self.profiler.span("description_parse", desc_dict["rpkgname"]):
+                self.apply_record(desc_dict, parse_dcf_record(manifest["description"]))
+            self.apply_manifest(desc_dict, manifest)
+        desc_dict["complete"] = True
+        return desc_dict
+
+    def apply_manifest(self, desc_dict, manifest):
+        """
+        fill the fields of a parse_description result that come from the content of the source tarball
+        """
+        desc_dict["languages"] = manifest["languages"]
+        desc_dict["makedepends"] = sorted(
+            self.language_makedepends[_] for _ in manifest["languages"] if _ in self.language_makedepends)
+        # DESCRIPTION without NeedsCompilation, src files are compiled all the same
+        if manifest["languages"]:
+            desc_dict["arch"] = "x86_64"
+        # install the license file the tarball has, which may be spelled differently from the License field
+        license_filename = desc_dict["license_filename"]
+        if license_filename and license_filename not in manifest["license_files"]:
+            alternatives = [_ for _ in ["LICENSE", "LICENCE"] if _ in manifest["license_files"]]
+            desc_dict["license_filename"] = alternatives[0] if alternatives else None
+
+    def complete_descriptions(self, desc_dicts, clean=True, jobs=1):
+        """ complete_description for several parse_description results, fetching up to `jobs` tarballs in parallel
+        return: list of (desc_dict, exception) pairs in the order of `desc_dicts`
+        """
+        return self.map_jobs(lambda _: self.complete_description(_, clean), desc_dicts, jobs)
+
+    def record_r_depends(self, record):
+        """
+        return sorted R deps of a PackageRecord, i.e. its Imports, Depends and LinkingTo without self.exclude_pkgs
+        """
+        r_deps = [_[0] for _ in record.imports + record.depends + record.linkingto]
+        return sorted(set(r_deps) - self.exclude_pkgs)
+
+    def apply_record(self, desc_dict, record):
+        """
+        fill the fields of a parse_description result that come from a DESCRIPTION file or PACKAGES entry
+        """
+        if "Title" in record:
+            desc_dict["title"] = record["Title"].replace(
                 '\n', ' ').strip()
-        if "needscompilation" in config[rpkgname]:
-            if config[rpkgname]["needscompilation"] == "yes":
-                result["arch"] = "x86_64"
-        r_deps = []
-        if "imports" in config[rpkgname]:
-            r_deps += config[rpkgname]["imports"].split(',')
-        if "depends" in config[rpkgname]:
-            r_deps += config[rpkgname]["depends"].split(',')
-        if "linkingto" in config[rpkgname]:
-            r_deps += config[rpkgname]["linkingto"].split(',')
-        r_deps = [_.split('(')[0].strip() for _ in r_deps]
-        r_deps = list(set(r_deps) - self.exclude_pkgs)
-        if '' in r_deps:
-            r_deps.remove('')
-        result["r_depends"] = sorted(r_deps)
-        result["depends"] += [f"r-{_.lower()}" for _ in result["r_depends"]]
-        result["depends"] = sorted(result["depends"])
-        r_optdeps = []
-        if "suggests" in config[rpkgname]:
-            r_optdeps += config[rpkgname]["suggests"].strip().split(',')
-        if "enhances" in config[rpkgname]:
-            r_optdeps += config[rpkgname]["enhances"].strip().split(',')
-        r_optdeps = [_.split('(')[0].strip() for _ in r_optdeps]
-        if '' in r_optdeps:
-            r_optdeps.remove('')
-        result["r_optdepends"] = sorted(r_optdeps)
-        result["optdepends"] = sorted(
-            [f"r-{_.lower()}" for _ in result['r_optdepends']])
-        if "systemrequirements" in config[rpkgname]:
-            result["systemrequirements"] = config[rpkgname]["systemrequirements"].replace(
+        if record.get("NeedsCompilation") == "yes":
+            desc_dict["arch"] = "x86_64"
+        desc_dict["r_depends"] = self.record_r_depends(record)
+        desc_dict["depends"] = sorted(
+            ["r"] + [f"r-{_.lower()}" for _ in desc_dict["r_depends"]])
+        r_optdeps = [_[0] for _ in record.suggests + record.enhances]
+        desc_dict["r_optdepends"] = sorted(r_optdeps)
+        desc_dict["optdepends"] = sorted(
+            [f"r-{_.lower()}" for _ in desc_dict['r_optdepends']])
+        if "SystemRequirements" in record:
+            desc_dict["systemrequirements"] = record["SystemRequirements"].replace(
                 '\n', '').strip()
         # deal with license
-        if "LGPL" in config[rpkgname]["license"] or config[rpkgname]["license"] == "GNU Lesser General Public License":
-            result["license"] = "LGPL"
-        elif "AGPL" in config[rpkgname]["license"] or config[rpkgname]["license"] == "GNU Affero General Public License":
-            result["license"] = "AGPL"
-        elif "GNU General Public License" in config[rpkgname]["license"] or "GPL" in config[rpkgname]["license"]:
-            result["license"] = "GPL"
-        elif "Apache" in config[rpkgname]["license"]:
-            result["license"] = "Apache"
-        elif "BSD" in config[rpkgname]["license"]:
-            result["license"] = "BSD"
-            if "file LICENSE" in config[rpkgname]["license"]:
-                result["license_filename"] = "LICENSE"
-            if "file LICENCE" in config[rpkgname]["license"]:
-                result["license_filename"] = "LICENCE"
-        elif "Artistic" in config[rpkgname]["license"]:
-            result["license"] = "Artistic2.0"
-        elif "CC BY" in config[rpkgname]["license"] or config[rpkgname]["license"] == "Creative Commons Attribution 4.0 International License":
-            result["license"] = "CCPL:by-nc-sa"
-        elif config[rpkgname]["license"] in ["Mozilla Public License 1.1",
-                                             "MPL",
-                                             "MPL-1.1"]:
-            result["license"] = "MPL"
-        elif config[rpkgname]["license"] in [
-            "Mozilla Public License 2.0",
-            "Mozilla Public License Version 2.0",
-            "MPL (>= 2)",
-            "MPL (== 2.0)",
-            "MPL (>= 2.0)",
-            "MPL-2.0",
-            "MPL-2.0 | file LICENSE",
-            "MPL (>= 2) | file LICENSE"
-        ]:
-            result["license"] = "MPL2"
-        elif "CPL" in config[rpkgname]["license"] or config[rpkgname]["license"] == "Common Public License Version 1.0":
-            result["license"] = "CPL"
-        elif "MIT" in config[rpkgname]["license"]:
-            result["license"] = "MIT"
-            if "file LICENSE" in config[rpkgname]["license"]:
-                result["license_filename"] = "LICENSE"
-            if "file LICENCE" in config[rpkgname]["license"]:
-                result["license_filename"] = "LICENCE"
-        elif "EPL" in config[rpkgname]["license"]:
-            result["license"] = "EPL"
-        elif "CeCILL" in config[rpkgname]["license"]:
-            result["license"] = "CeCILL"
-            if "file LICENSE" in config[rpkgname]["license"]:
-                result["license_filename"] = "LICENSE"
-            if "file LICENCE" in config[rpkgname]["license"]:
-                result["license_filename"] = "LICENCE"
-        elif "EUPL" in config[rpkgname]["license"]:
-            result["license"] = "EUPL"
-            if "file LICENSE" in config[rpkgname]["license"]:
-                result["license_filename"] = "LICENSE"
-            if "file LICENCE" in config[rpkgname]["license"]:
-                result["license_filename"] = "LICENCE"
-        elif "ACM" in config[rpkgname]["license"]:
-            result["license"] = "ACM"
-            if "file LICENSE" in config[rpkgname]["license"]:
-                result["license_filename"] = "LICENSE"
-            if "file LICENCE" in config[rpkgname]["license"]:
-                result["license_filename"] = "LICENCE"
-        elif "BSL" in config[rpkgname]["license"]:
-            result["license"] = "BSL"
-            if "file LICENSE" in config[rpkgname]["license"]:
-                result["license_filename"] = "LICENSE"
-            if "file LICENCE" in config[rpkgname]["license"]:
-                result["license_filename"] = "LICENCE"
-        elif "CC0" in config[rpkgname]["license"]:
-            result["license"] = "CC0"
-            if "file LICENSE" in config[rpkgname]["license"]:
-                result["license_filename"] = "LICENSE"
-            if "file LICENCE" in config[rpkgname]["license"]:
-                result["license_filename"] = "LICENCE"
-        elif "Lucent Public License" in config[rpkgname]["license"]:
-            result["license"] = "Lucent Public License"
-            if "file LICENSE" in config[rpkgname]["license"]:
-                result["license_filename"] = "LICENSE"
-            if "file LICENCE" in config[rpkgname]["license"]:
-                result["license_filename"] = "LICENCE"
-        elif "Unlimited" in config[rpkgname]["license"]:
-            result["license"] = "Unlimited"
-            if "file LICENSE" in config[rpkgname]["license"]:
-                result["license_filename"] = "LICENSE"
-            if "file LICENCE" in config[rpkgname]["license"]:
-                result["license_filename"] = "LICENCE"
-        else:
-            result["license"] = "custom"
-            if "file LICENSE" in config[rpkgname]["license"]:
-                result["license_filename"] = "LICENSE"
-            if "file LICENCE" in config[rpkgname]["license"]:
-                result["license_filename"] = "LICENCE"
+        desc_dict["license"], desc_dict["license_filename"] = classify_license(
+            record.get("License", ""))
 
-        return result
+    def write_file(self, filename, content):
+        """ write a generated file, unless it has this content already, see write_if_changed
+        return: True if the file was written, False if it was unchanged
+        """
+        written = write_if_changed(filename, content)
+        with self.files_written_lock:
+            if written:
+                self.files_written += 1
+            else:
+                self.files_unchanged += 1
+        return written
 
     def write_lilac_yaml(self, filename, desc_dict):
+        """
+        write lilac.yaml of a pkg, see write_file
+        """
+        return self.write_file(filename, self.render_lilac_yaml(desc_dict))
+
+    def render_lilac_yaml(self, desc_dict):
         url = desc_dict["project_url"].replace(
             '${_pkgname}', desc_dict["rpkgname"])
         yaml_dict = {
@@ -434,16 +722,19 @@ class PKGBUILDGenerator(object):
                 "source": "github",
                 "github": f'{desc_dict["github_owner"]}/{desc_dict["rpkgname"]}',
                 "use_latest_release": True}]
-        repo_depends = desc_dict["depends"]
-        repo_depends.remove("r")
+        repo_depends = [_ for _ in desc_dict["depends"] if _ != "r"]
         if repo_depends:
             yaml_dict["repo_depends"] = repo_depends
-        with open(filename, "w", newline='\n') as f:
-            yaml.safe_dump(yaml_dict, f)
-        # run prettier to make pretty yaml
-        os.system(f'prettier -w {filename}')
+        # written in the style of prettier-formatted `yaml.safe_dump` output, without running prettier
+        return dump_yaml(yaml_dict)
 
     def write_lilac_py(self, filename, desc_dict):
+        """
+        write lilac.py of a pkg, see write_file
+        """
+        return self.write_file(filename, self.render_lilac_py(desc_dict))
+
+    def render_lilac_py(self, desc_dict):
         # currently, we do not generate `lilac.py` for R package from github
         import_line = '\n'.join([
             "#!/usr/bin/env python3",
@@ -474,8 +765,7 @@ class PKGBUILDGenerator(object):
             pre_build_line,
             post_build_line
         ])
-        with open(filename, "w", newline='\n') as f:
-            f.write(file_content)
+        return file_content
 
     def write_pkgbuild(self, filename, desc_dict):
         """
@@ -483,6 +773,13 @@ class PKGBUILDGenerator(object):
         args:
             filename: the PKGBUILD file path
             desc_dict: dict contains information parsed from DESCRIPTION file
+        return: True if the file was written, False if it was unchanged, see write_file
+        """
+        return self.write_file(filename, self.render_pkgbuild(desc_dict))
+
+    def render_pkgbuild(self, desc_dict):
+        """
+        return content of the PKGBUILD file based on information parsed from DESCRIPTION file
         """
         depends = '\n'.join([
             'depends=(',
@@ -550,7 +847,7 @@ class PKGBUILDGenerator(object):
         optdepends_line = optdepends
         makedepends_line = makedepends
         source_line = f'source=("{desc_dict["source"]}")'
-        checksums_line = "sha256sums=('a')\n"
+        checksums_line = f"sha256sums=('{desc_dict.get('sha256sum') or 'a'}')\n"
         build_line = build_func + '\n'
         package_line = package_func
         end_line = '# vim:set ts=2 sw=2 et:\n'
@@ -591,70 +888,552 @@ class PKGBUILDGenerator(object):
         ]
 
         pkgbuild_content = '\n'.join(pkgbuild_lines)
-        with open(filename, 'w', newline='\n') as f:
-            f.write(pkgbuild_content)
+        return pkgbuild_content
 
-    def generate_pkgbuild(
+    def pkgbuild_dir(self, rpkgname, repo="cran", destdir='.'):
+        """
+        return the dir the PKGBUILD of `rpkgname` is written to
+        """
+        if repo == "github":
+            pkgname = f"r-{rpkgname.strip('/').split('/')[-1].lower()}"
+        else:
+            pkgname = f"r-{rpkgname.lower()}"
+        return osp.join(destdir, pkgname)
+
+    def dep_repo(self, rpkgname_dep):
+        """
+        return the repo of a dependency, CRAN if it's in CRAN, Bioconductor otherwise
+        """
+        # we can not know from DESCRIPTION if the pkg is in CRAN, so we check it here
+        # for pkg from github, we assume that it's deps are not from github anymore
+        if self.isInCran(rpkgname_dep):
+            return "cran"
+        return "bioconductor"
+
+    def map_jobs(self, func, items, jobs=1):
+        """ call `func` on each of `items`, in a pool of `jobs` threads if jobs > 1
+        return: list of (result, exception) pairs in the order of `items`, an exception raised by `func` is returned, not raised
+        """
+        def call(item):
+            try:
+                return func(item), None
+            except Exception as e:
+                return None, e
+
+        if jobs > 1 and len(items) > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+                return list(pool.map(call, items))
+        return [call(_) for _ in items]
+
+    def plan_waves(self, r_depends):
+        """ order a dependency graph into waves with Kahn's algorithm
+        param: r_depends: rpkgname -> its deps, deps missing from the keys are ignored
+        return: list of waves, each wave is a sorted list of rpkgnames whose deps are all in earlier waves
+        raise: RuntimeError if there is a dependency cycle
+        """
+        # in-degree counts, so each edge is visited once rather than rescanning all pkgs per wave
+        n_deps = {}
+        dependents = collections.defaultdict(list)
+        for name, deps in r_depends.items():
+            deps = set(deps) & r_depends.keys()
+            n_deps[name] = len(deps)
+            for dep in deps:
+                dependents[dep].append(name)
+        plan = []
+        wave = sorted([name for name, n in n_deps.items() if n == 0])
+        while wave:
+            plan.append(wave)
+            next_wave = []
+            for name in wave:
+                del n_deps[name]
+                for dependent in dependents.get(name, ()):
+                    n_deps[dependent] -= 1
+                    if n_deps[dependent] == 0:
+                        next_wave.append(dependent)
+            wave = sorted(next_wave)
+        if n_deps:
+            cycle = sorted(n_deps)
+            raise RuntimeError(
+                f"dependency cycle found among {len(cycle)} pkgs: {cycle[:20]}")
+        return plan
+
+    def resolve_dependencies(
         self,
         rpkgname,
-        maintainer_github,
+        repo="cran",
         skip=False,
-        recursive=False,
+        verbose=False,
+        clean=True,
+        destdir='.',
+        jobs=1,
+        metadata_only=False
+    ):
+        """ build the transitive dependency DAG of `rpkgname`, visiting each pkg exactly once
+        args:
+            rpkgname: pkgname in R (CRAN, Bioconductor, Github), for github, rpkgname should be github_owner/github_repo
+            repo: repo that pkgname is in, CRAN, Bioconductor, github
+            skip: do not visit pkgs whose PKGBUILD exists in `destdir`, nor their deps
+            verbose: be verbose
+            clean: passed to parse_description
+            destdir: dir of the PKGBUILDs
+            jobs: number of pkgs to fetch and parse in parallel
+            metadata_only: resolve from the PACKAGES indexes without fetching tarballs, see parse_description
+        return: (plan, desc_dicts)
+            plan: build plan, a list of waves, each wave is a sorted list of rpkgnames whose deps are all in earlier waves,
+                so pkgs in one wave can be built in parallel
+            desc_dicts: rpkgname -> parse_description result, None for pkgs skipped as their PKGBUILD exists
+        raise: RuntimeError if there is a dependency cycle, or the error of the first pkg that failed to parse
+        """
+        plan, desc_dicts, failures = self.resolve_dependency_graph(
+            [(rpkgname, repo)], skip=skip, verbose=verbose, clean=clean, destdir=destdir, jobs=jobs,
+            metadata_only=metadata_only)
+        for error in failures.values():
+            raise error
+        return plan, desc_dicts
+
+    def resolve_dependency_graph(
+        self,
+        roots,
+        skip=False,
+        verbose=False,
+        clean=True,
+        destdir='.',
+        jobs=1,
+        metadata_only=False
+    ):
+        """ build the transitive dependency DAG of several pkgs, deps shared by them are visited once
+        args:
+            roots: list of (rpkgname, repo)
+            others: see resolve_dependencies
+        return: (plan, desc_dicts, failures)
+            plan, desc_dicts: see resolve_dependencies, pkgs that failed to parse are leaves with a None desc_dict
+            failures: rpkgname -> exception raised while parsing it
+        raise: RuntimeError if there is a dependency cycle
+        """
+        desc_dicts = {}
+        r_depends = {}
+        failures = {}
+        seen = set([_[0] for _ in roots])
+        # breadth-first, one level at a time, pkgs of a level are parsed in parallel
+        level = list(roots)
+        while level:
+            to_parse = []
+            for name, name_repo in level:
+                if skip and osp.exists(osp.join(self.pkgbuild_dir(name, name_repo, destdir), "PKGBUILD")):
+                    if verbose:
+                        print(
+                            f"skip PKGBUILD generation of pkg: {name} as it exists")
+                    name = name.strip('/').split('/')[-1]
+                    desc_dicts[name] = None
+                    r_depends[name] = []
+                else:
+                    if verbose:
+                        print(f"resolving dependencies of pkg: {name}")
+                    to_parse.append((name, name_repo))
+            results = self.map_jobs(
+                lambda _: self.parse_description(_[0], _[1], clean, metadata_only), to_parse, jobs)
+            level = []
+            for (name, name_repo), (desc_dict, error) in zip(to_parse, results):
+                if error is not None:
+                    failures[name] = error
+                    name = name.strip('/').split('/')[-1]
+                    desc_dicts[name] = None
+                    r_depends[name] = []
+                    continue
+                # for github, the key is the repo name, which is also the rpkgname
+                name = desc_dict["rpkgname"]
+                desc_dicts[name] = desc_dict
+                r_depends[name] = desc_dict["r_depends"]
+                seen.add(name)
+                for rpkgname_dep in desc_dict["r_depends"]:
+                    if rpkgname_dep not in seen:
+                        seen.add(rpkgname_dep)
+                        level.append(
+                            (rpkgname_dep, self.dep_repo(rpkgname_dep)))
+
+        return self.plan_waves(r_depends), desc_dicts, failures
+
+    def write_package(
+        self,
+        desc_dict,
+        maintainer_github,
         maintainer=None,
         email=None,
         verbose=False,
         updpkgsums=False,
-        repo="cran",
-        clean=True,
-        destdir='.'
+        destdir='.',
+        clean=True
     ):
-        if repo == "github":
-            pkgname = f"r-{rpkgname.strip('/').split('/')[-1].lower()}"
-        else:
-            pkgname = f"r-{rpkgname.lower()}"
+        """
+        write PKGBUILD, lilac.yaml and lilac.py of a pkg parsed by parse_description, completing it first if needed
+        """
         if verbose:
-            print(f"generating PKGBUILD for pkg: {rpkgname}")
-        pkgbuild_filename = f"{osp.join(destdir, pkgname)}/PKGBUILD"
-        lilac_yaml_filename = f"{osp.join(destdir, pkgname)}/lilac.yaml"
-        lilac_py_filename = f"{osp.join(destdir, pkgname)}/lilac.py"
-        if skip and osp.exists(pkgbuild_filename):
-            if verbose:
-                print(
-                    f"skip PKGBUILD generation of pkg: {pkgname} as it exists")
-            return
-        desc_dict = self.parse_description(rpkgname, repo, clean)
+            print(f"generating PKGBUILD for pkg: {desc_dict['rpkgname']}")
+        self.complete_description(desc_dict, clean)
+        pkgdir = self.pkgbuild_dir(desc_dict["rpkgname"], destdir=destdir)
+        pkgbuild_filename = f"{pkgdir}/PKGBUILD"
+        lilac_yaml_filename = f"{pkgdir}/lilac.yaml"
+        lilac_py_filename = f"{pkgdir}/lilac.py"
         desc_dict["maintainer"] = maintainer
         desc_dict["email"] = email
         desc_dict["maintainer_github"] = maintainer_github
 
-        os.makedirs(osp.join(destdir, pkgname), exist_ok=True)
-        self.write_pkgbuild(pkgbuild_filename, desc_dict)
-        self.write_lilac_yaml(lilac_yaml_filename, desc_dict)
-        self.write_lilac_py(lilac_py_filename, desc_dict)
+        with self.profiler.span("render", desc_dict["rpkgname"]) as span:
+            # render all files first, so a failure leaves no pkg dir with some of them updated
+            contents = {
+                pkgbuild_filename: self.render_pkgbuild(desc_dict),
+                lilac_yaml_filename: self.render_lilac_yaml(desc_dict),
+                lilac_py_filename: self.render_lilac_py(desc_dict)
+            }
+            os.makedirs(pkgdir, exist_ok=True)
+            span["written"] = [osp.basename(filename) for filename, content in contents.items()
+                               if self.write_file(filename, content)]
         if updpkgsums:
+            # the checksum is computed from the downloaded tarball already, updpkgsums only double-checks it,
+            # updpkgsums rewrites the file it's given, so it's run on a copy and an unchanged PKGBUILD keeps its mtime
             if verbose:
-                print("updating source checksums")
-            os.system(f"updpkgsums {pkgbuild_filename}")
+                print("verifying source checksums")
+            fd, verify_filename = tempfile.mkstemp(dir=pkgdir, prefix=".PKGBUILD.")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    f.write(contents[pkgbuild_filename])
+                with self.profiler.span("updpkgsums", desc_dict["rpkgname"]):
+                    try:
+                        subprocess.run(["updpkgsums", osp.abspath(verify_filename)], check=True)
+                    except (OSError, subprocess.CalledProcessError) as e:
+                        raise RuntimeError(f"Failed to verify the checksums in {pkgbuild_filename} with updpkgsums: {e}")
+                with open(verify_filename, "r") as f:
+                    verified_content = f.read()
+            finally:
+                os.remove(verify_filename)
+            if verified_content != contents[pkgbuild_filename]:
+                raise RuntimeError(
+                    f"updpkgsums changed the checksums in {pkgbuild_filename}, the source tarball may have changed on the mirror")
+
+    def generate_pkgbuild(
+        self,
+        rpkgname,
+        maintainer_github,
+        skip=False,
+        recursive=False,
+        maintainer=None,
+        email=None,
+        verbose=False,
+        updpkgsums=False,
+        repo="cran",
+        clean=True,
+        destdir='.'
+    ):
+        """ generate PKGBUILD of one pkg, see generate_pkgbuilds for args
+        raise: the exception raised for the first pkg that failed
+        """
+        failures = self.generate_pkgbuilds(
+            [rpkgname],
+            maintainer_github,
+            skip=skip,
+            recursive=recursive,
+            maintainer=maintainer,
+            email=email,
+            verbose=verbose,
+            updpkgsums=updpkgsums,
+            repo=repo,
+            clean=clean,
+            destdir=destdir
+        )
+        if failures:
+            raise next(iter(failures.values()))
+
+    def writable_names(self, wave, desc_dicts, failures):
+        """ pick the pkgs of a wave of plan_pkgbuilds to write, a pkg whose deps failed is recorded as failed instead,
+        its PKGBUILD would refer to PKGBUILDs that do not exist
+        args:
+            wave: rpkgnames of a wave, the deps of its pkgs are in earlier waves, so their failures are known
+            desc_dicts, failures: see plan_pkgbuilds, `failures` is updated in place
+        return: rpkgnames to write, in the order of `wave`
+        """
+        names = []
+        for name in wave:
+            if desc_dicts[name] is None or name in failures:
+                continue
+            failed_depends = sorted([_ for _ in desc_dicts[name]["r_depends"] if _ in failures])
+            if failed_depends:
+                failures[name] = RuntimeError(f"not generated as its deps failed: {', '.join(failed_depends)}")
+            else:
+                names.append(name)
+        return names
+
+    def plan_pkgbuilds(
+        self,
+        rpkgnames,
+        skip=False,
+        recursive=False,
+        verbose=False,
+        repo="cran",
+        clean=True,
+        destdir='.',
+        jobs=1
+    ):
+        """ plan the PKGBUILDs generate_pkgbuilds writes, from the PACKAGES indexes, no CRAN or Bioconductor tarball is fetched
+        args: see generate_pkgbuilds
+        return: (plan, desc_dicts, failures, given_names)
+            plan: list of waves, each a list of rpkgnames whose deps are all in earlier waves
+            desc_dicts: rpkgname -> parse_description result with metadata_only, None if it's skipped
+            failures: rpkgname -> exception, for pkgs that could not be planned, a pkg not found is keyed by the name given
+            given_names: rpkgname -> names of `rpkgnames` it was looked up from, see rename_failures
+        """
+        failures = {}
+        roots = []
+        given_names = {}
+        for name in rpkgnames:
+            rpkgname = name
+            if repo != "github":
+                try:
+                    rpkgname = self.get_rpkgname(name)
+                except RuntimeError as e:
+                    failures[name] = e
+                    continue
+            if rpkgname not in given_names:
+                roots.append((rpkgname, repo))
+            given_names.setdefault(rpkgname, []).append(name)
         if recursive:
-            for rpkgname_dep in desc_dict["r_depends"]:
-                # for pkg dep not from cran repo, check if it's in CRAN
-                # we can not know if the pkg in cran in recursive mode
-                # so we check it here
-                # for pkg from github, we assume that it's deps are not from github anymore
-                if self.isInCran(rpkgname_dep):
-                    repo = "cran"
-                else:
-                    repo = "bioconductor"
-                self.generate_pkgbuild(
-                    rpkgname_dep,
+            # shared deps of all roots are fetched and written once,
+            # they are planned from the PACKAGES indexes, tarballs are only fetched when a pkg is written
+            with self.profiler.span("resolve"):
+                plan, desc_dicts, resolve_failures = self.resolve_dependency_graph(
+                    roots, skip=skip, verbose=verbose, clean=clean, destdir=destdir, jobs=jobs,
+                    metadata_only=True)
+            failures.update(resolve_failures)
+        else:
+            plan = [[]]
+            desc_dicts = {}
+            to_parse = []
+            for rpkgname, _ in roots:
+                if skip and osp.exists(f"{self.pkgbuild_dir(rpkgname, repo, destdir)}/PKGBUILD"):
+                    if verbose:
+                        print(
+                            f"skip PKGBUILD generation of pkg: {rpkgname} as it exists")
+                    continue
+                to_parse.append(rpkgname)
+            results = self.map_jobs(
+                lambda _: self.parse_description(_, repo, clean, metadata_only=True), to_parse, jobs)
+            for rpkgname, (desc_dict, error) in zip(to_parse, results):
+                if error is not None:
+                    failures[rpkgname] = error
+                elif desc_dict["rpkgname"] not in desc_dicts:
+                    plan[0].append(desc_dict["rpkgname"])
+                    desc_dicts[desc_dict["rpkgname"]] = desc_dict
+        return plan, desc_dicts, failures, given_names
+
+    def rename_failures(self, failures, given_names):
+        """ key the failures of the pkgs given to generate_pkgbuilds by the names they were given as, e.g. r-foo or FOO,
+        so callers can match them to their input
+        args: see plan_pkgbuilds
+        return: failures, those of given pkgs keyed by the names given, those of their deps by rpkgname
+        """
+        renamed = {}
+        for rpkgname, error in failures.items():
+            for name in given_names.get(rpkgname, [rpkgname]):
+                renamed[name] = error
+        return renamed
+
+    def generate_pkgbuilds(
+        self,
+        rpkgnames,
+        maintainer_github,
+        skip=False,
+        recursive=False,
+        maintainer=None,
+        email=None,
+        verbose=False,
+        updpkgsums=False,
+        repo="cran",
+        clean=True,
+        destdir='.',
+        jobs=1
+    ):
+        """ generate PKGBUILDs of several pkgs, fetching and writing up to `jobs` pkgs in parallel
+        args:
+            rpkgnames: pkgnames in R, for CRAN and Bioconductor they are looked up case-insensitively,
+                ArchLinux pkgnames like r-foo are accepted too, see get_rpkgname
+            jobs: number of pkgs to process in parallel
+            skip: skip pkgs whose PKGBUILD exists in `destdir`, and their deps if `recursive`
+            recursive: also generate the PKGBUILDs of the deps, a pkg whose deps failed is not generated and fails too
+            repo: repo of `rpkgnames`, "cran", "bioconductor" or "github", for github they are github_owner/github_repo
+            clean: do not keep a copy of the source tarballs in cwd
+            destdir: dir to write the PKGBUILDs to, one subdir per pkg
+            others: see write_package
+        return: rpkgname -> exception, for pkgs that failed, a failure does not stop the others,
+            pkgs of `rpkgnames` are keyed by the names given
+        """
+        plan, desc_dicts, failures, given_names = self.plan_pkgbuilds(
+            rpkgnames, skip=skip, recursive=recursive, verbose=verbose, repo=repo, clean=clean, destdir=destdir,
+            jobs=jobs)
+        for wave in plan:
+            names = self.writable_names(wave, desc_dicts, failures)
+            results = self.map_jobs(
+                lambda _: self.write_package(
+                    desc_dicts[_],
                     maintainer_github,
-                    skip=skip,
-                    recursive=recursive,
                     maintainer=maintainer,
                     email=email,
                     verbose=verbose,
                     updpkgsums=updpkgsums,
-                    repo=repo,
                     destdir=destdir,
                     clean=clean
-                )
+                ), names, jobs)
+            for name, (_, error) in zip(names, results):
+                if error is not None:
+                    failures[name] = error
+        return self.rename_failures(failures, given_names)
+
+    def read_pkgbuild(self, filename):
+        """ read pkg info back from a PKGBUILD written by write_pkgbuild
+        param: filename: the PKGBUILD file path
+        return: dict with rpkgname, rpkgver, repo and github_owner (github only), None if it's not a PKGBUILD of an R pkg
+        """
+        fields = {}
+        with open(filename, "r") as f:
+            for line in f:
+                for field in ["_pkgname", "_pkgver", "pkgver", "url"]:
+                    if line.startswith(f"{field}=") and field not in fields:
+                        fields[field] = line[len(field) + 1:].strip().strip("'\"")
+        if "_pkgname" not in fields or "url" not in fields:
+            return None
+        info = {"rpkgname": fields["_pkgname"], "github_owner": None}
+        if fields["url"].startswith("https://github.com/"):
+            info["repo"] = "github"
+            info["github_owner"] = fields["url"].rstrip('/').split('/')[-2]
+            info["rpkgver"] = fields.get("pkgver")
+        elif "bioconductor.org" in fields["url"]:
+            info["repo"] = "bioconductor"
+            info["rpkgver"] = fields.get("_pkgver")
+        else:
+            info["repo"] = "cran"
+            info["rpkgver"] = fields.get("_pkgver")
+        return info
+
+    def list_pkgbuilds(self, destdir='.'):
+        """
+        return read_pkgbuild results of all `r-*/PKGBUILD` in `destdir`, sorted by dir name
+        """
+        pkgbuilds = []
+        for pkgdir in sorted(os.listdir(destdir)):
+            filename = osp.join(destdir, pkgdir, "PKGBUILD")
+            if not pkgdir.startswith("r-") or not osp.isfile(filename):
+                continue
+            info = self.read_pkgbuild(filename)
+            if info is not None:
+                pkgbuilds.append(info)
+        return pkgbuilds
+
+    def find_stale_packages(self, destdir='.', jobs=1):
+        """ compare versions of the PKGBUILDs in `destdir` with the PACKAGES indexes, and github releases for github pkgs
+        args:
+            destdir: dir of the PKGBUILDs
+            jobs: number of github pkgs to check in parallel
+        return: (stale, failures)
+            stale: list of read_pkgbuild results of outdated pkgs, with the upstream version in "new_rpkgver"
+            failures: rpkgname -> exception, for pkgs whose upstream version could not be found
+        """
+        stale = []
+        failures = {}
+        pkgbuilds = self.list_pkgbuilds(destdir)
+
+        def upstream_ver(info):
+            if info["repo"] == "github":
+                github_rpkgver = self.get_github_ver(
+                    info["github_owner"], info["rpkgname"])
+                # pkgver of github pkgs is written this way by write_pkgbuild
+                return github_rpkgver.lstrip('v').replace(":", "").replace("-", "")
+            if info["repo"] == "bioconductor":
+                return self.get_bioconductor_ver(info["rpkgname"])
+            return self.get_cran_ver(info["rpkgname"])
+
+        results = self.map_jobs(upstream_ver, pkgbuilds, jobs)
+        for info, (new_rpkgver, error) in zip(pkgbuilds, results):
+            if error is not None:
+                failures[info["rpkgname"]] = error
+            elif new_rpkgver != info["rpkgver"]:
+                info["new_rpkgver"] = new_rpkgver
+                stale.append(info)
+        return stale, failures
+
+    def update_pkgbuilds(
+        self,
+        maintainer_github,
+        maintainer=None,
+        email=None,
+        verbose=False,
+        updpkgsums=False,
+        clean=True,
+        destdir='.',
+        jobs=1
+    ):
+        """ regenerate the PKGBUILDs in `destdir` whose upstream version changed, only their tarballs are fetched
+        args: see generate_pkgbuilds
+        return: (stale, failures), see find_stale_packages, failures also include pkgs that failed to regenerate
+        """
+        stale, failures = self.find_stale_packages(destdir, jobs=jobs)
+        for repo in self.repos:
+            rpkgnames = [_["rpkgname"] if repo != "github" else f"{_['github_owner']}/{_['rpkgname']}"
+                         for _ in stale if _["repo"] == repo]
+            if not rpkgnames:
+                continue
+            failures.update(self.generate_pkgbuilds(
+                rpkgnames,
+                maintainer_github,
+                maintainer=maintainer,
+                email=email,
+                verbose=verbose,
+                updpkgsums=updpkgsums,
+                repo=repo,
+                clean=clean,
+                destdir=destdir,
+                jobs=jobs
+            ))
+        return stale, failures
+
+    def get_reverse_index(self):
+        """ get the reverse-dependency index of all pkgs in CRAN and Bioconductor, build it on first use
+        return: rpkgname -> set of rpkgnames that import, depend on or link to it
+        """
+        with self.index_lock:
+            if self.reverse_index is not None:
+                return self.reverse_index
+        reverse_index = collections.defaultdict(set)
+        for rpkgname, repo in self.list_packages():
+            for rpkgname_dep in self.record_r_depends(self.find_record(rpkgname, repo)):
+                reverse_index[rpkgname_dep].add(rpkgname)
+        with self.index_lock:
+            self.reverse_index = dict(reverse_index)
+        return self.reverse_index
+
+    def rebuild_plan(self, rpkgnames, destdir='.'):
+        """ find the pkgs in `destdir` that must be rebuilt when `rpkgnames` change, from the PACKAGES indexes only
+        args:
+            rpkgnames: changed pkgs, pkg names in R
+            destdir: dir of the PKGBUILDs, only pkgs with a PKGBUILD there are returned
+        return: build plan, a list of waves, see resolve_dependencies, changed pkgs are included if they are in `destdir`
+        """
+        reverse_index = self.get_reverse_index()
+        # all transitive reverse deps, pkgs outside destdir are walked through as they link ours together
+        affected = set(rpkgnames)
+        queue = collections.deque(rpkgnames)
+        while queue:
+            for rpkgname in reverse_index.get(queue.popleft(), ()):
+                if rpkgname not in affected:
+                    affected.add(rpkgname)
+                    queue.append(rpkgname)
+        # order the affected subgraph, then keep the pkgs in destdir
+        r_depends = {}
+        for rpkgname in affected:
+            record = self.find_record(rpkgname, self.dep_repo(rpkgname))
+            deps = self.record_r_depends(record) if record is not None else []
+            r_depends[rpkgname] = [_ for _ in deps if _ in affected]
+        local = set([_["rpkgname"] for _ in self.list_pkgbuilds(destdir)])
+        plan = []
+        for wave in self.plan_waves(r_depends):
+            wave = [_ for _ in wave if _ in local]
+            if wave:
+                plan.append(wave)
+        return plan
@@ -0,0 +1,113 @@
+import asyncio
+
+from .PKGBUILDGenerator import PKGBUILDGenerator
+
+
+class AsyncPKGBUILDGenerator(object):
+    def __init__(self, gen=None, concurrency=8, session=None, **kwargs):
+        """asyncio API of PKGBUILDGenerator, for event loops such as bots reacting to upstream releases
+
+        blocking network and file I/O runs in worker threads, at most `concurrency` at a time, so the loop never stalls,
+        parsing and templating are the ones of PKGBUILDGenerator, the output is the same as the sync API's
+        param: gen, PKGBUILDGenerator to use, default: a new one created with `session` and `kwargs`
+        param: concurrency, max number of blocking calls in flight, e.g. tarballs fetched at once
+        param: session, requests.Session used for all HTTP requests, only used if `gen` is not given
+        param: kwargs, passed to PKGBUILDGenerator if `gen` is not given
+        """
+        if gen is None:
+            kwargs.setdefault("max_connections_per_host", concurrency)
+            gen = PKGBUILDGenerator(session=session, **kwargs)
+        self.gen = gen
+        self.concurrency = concurrency
+        # created on first use, so it belongs to the running loop
+        self.semaphore = None
+
+    async def run(self, func, *args, **kwargs):
+        """
+        run the blocking `func` in a worker thread, waiting for a free slot of `concurrency` first
+        """
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        async with self.semaphore:
+            return await asyncio.to_thread(func, *args, **kwargs)
+
+    async def load_indexes(self):
+        """
+        load the PACKAGES indexes of CRAN and Bioconductor concurrently, they are otherwise loaded on first lookup
+        """
+        await asyncio.gather(*[self.run(self.gen.get_index, _) for _ in ["cran"] + self.gen.bioconductor_repos])
+
+    async def get_cran_ver(self, cran_name, ignore_case=False):
+        return await self.run(self.gen.get_cran_ver, cran_name, ignore_case=ignore_case)
+
+    async def get_bioconductor_ver(self, bio_name, return_idx=False, ignore_case=False):
+        return await self.run(self.gen.get_bioconductor_ver, bio_name, return_idx=return_idx, ignore_case=ignore_case)
+
+    async def get_github_ver(self, github_owner, github_repo):
+        return await self.run(self.gen.get_github_ver, github_owner, github_repo)
+
+    async def get_rpkgname(self, name):
+        return await self.run(self.gen.get_rpkgname, name)
+
+    async def parse_description(self, rpkgname, repo="cran", clean=True, metadata_only=False):
+        return await self.run(self.gen.parse_description, rpkgname, repo, clean, metadata_only)
+
+    async def generate_pkgbuild(self, rpkgname, maintainer_github, **kwargs):
+        """ generate PKGBUILD of one pkg, see generate_pkgbuilds for args
+        raise: the exception raised for the first pkg that failed
+        """
+        failures = await self.generate_pkgbuilds([rpkgname], maintainer_github, **kwargs)
+        if failures:
+            raise next(iter(failures.values()))
+
+    async def generate_pkgbuilds(
+        self,
+        rpkgnames,
+        maintainer_github,
+        skip=False,
+        recursive=False,
+        maintainer=None,
+        email=None,
+        verbose=False,
+        updpkgsums=False,
+        repo="cran",
+        clean=True,
+        destdir='.'
+    ):
+        """ generate PKGBUILDs of several pkgs, all tarballs are fetched concurrently, see PKGBUILDGenerator.generate_pkgbuilds
+        args:
+            rpkgnames: pkgnames in R, see PKGBUILDGenerator.generate_pkgbuilds
+            others: see PKGBUILDGenerator.generate_pkgbuilds
+        return: rpkgname -> exception, for pkgs that failed, a failure does not stop the others,
+            pkgs of `rpkgnames` are keyed by the names given
+        """
+        gen = self.gen
+        # planned from the PACKAGES indexes, only github pkgs are fetched here
+        plan, desc_dicts, failures, given_names = await asyncio.to_thread(
+            gen.plan_pkgbuilds, rpkgnames, skip=skip, recursive=recursive, verbose=verbose, repo=repo, clean=clean,
+            destdir=destdir, jobs=self.concurrency)
+
+        # fetch the tarballs of all pkgs at once, waves only order the writes
+        names = [_ for wave in plan for _ in wave if desc_dicts[_] is not None]
+        results = await asyncio.gather(
+            *[self.run(gen.complete_description, desc_dicts[_], clean) for _ in names], return_exceptions=True)
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                failures[name] = result
+        for wave in plan:
+            names = gen.writable_names(wave, desc_dicts, failures)
+            results = await asyncio.gather(*[self.run(
+                gen.write_package,
+                desc_dicts[_],
+                maintainer_github,
+                maintainer=maintainer,
+                email=email,
+                verbose=verbose,
+                updpkgsums=updpkgsums,
+                destdir=destdir,
+                clean=clean
+            ) for _ in names], return_exceptions=True)
+            for name, result in zip(names, results):
+                if isinstance(result, Exception):
+                    failures[name] = result
+        return gen.rename_failures(failures, given_names)
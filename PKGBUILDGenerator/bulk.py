@@ -0,0 +1,133 @@
+import json
+import os
+import os.path as osp
+import time
+
+
+class Journal(object):
+    def __init__(self, filename):
+        """append-only JSONL checkpoint journal of a bulk run, one line per finished pkg
+        param: filename, journal file, it's created if it does not exist
+        """
+        self.filename = filename
+        self.done = set()
+        self.failed = {}
+        if osp.exists(filename):
+            with open(filename, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # a line cut short by an interrupted run
+                        continue
+                    key = (entry["rpkgname"], entry["repo"])
+                    if entry["status"] == "done":
+                        self.done.add(key)
+                        self.failed.pop(key, None)
+                    else:
+                        self.failed[key] = entry.get("error")
+        dirname = osp.dirname(filename)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self.f = open(filename, "a")
+        if self.f.tell() > 0:
+            with open(filename, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read() != b'\n':
+                    # terminate the line cut short, so the next entry starts on its own line
+                    self.f.write('\n')
+
+    def record(self, rpkgname, repo, error=None):
+        entry = {
+            "rpkgname": rpkgname,
+            "repo": repo,
+            "status": "done" if error is None else "failed",
+            "time": time.time()
+        }
+        if error is not None:
+            entry["error"] = str(error)
+            self.failed[(rpkgname, repo)] = entry["error"]
+        else:
+            self.done.add((rpkgname, repo))
+            self.failed.pop((rpkgname, repo), None)
+        self.f.write(json.dumps(entry) + '\n')
+
+    def flush(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def close(self):
+        self.f.close()
+
+
+def generate_bulk(
+    gen,
+    maintainer_github,
+    journal_filename,
+    repos=None,
+    regex=None,
+    exclude_regex=None,
+    maintainer=None,
+    email=None,
+    verbose=False,
+    updpkgsums=False,
+    clean=True,
+    destdir='.',
+    jobs=1,
+    chunk_size=None
+):
+    """ generate PKGBUILDs of all pkgs in the PACKAGES indexes, resuming from the checkpoint journal
+    args:
+        gen: PKGBUILDGenerator
+        journal_filename: checkpoint journal, pkgs recorded as done in it are not generated again
+        repos: repos to generate pkgs from, "cran" and/or "bioconductor", default: both
+        regex: only generate pkgs whose name matches this regex
+        exclude_regex: do not generate pkgs whose name matches this regex
+        chunk_size: number of pkgs generated between two checkpoints and progress reports, default: 8 * jobs
+        others: see PKGBUILDGenerator.generate_pkgbuilds
+    return: (rpkgname, repo) -> error message, for selected pkgs that failed in this run or an earlier one
+    """
+    journal = Journal(journal_filename)
+    packages = gen.list_packages(repos=repos, regex=regex)
+    if exclude_regex:
+        exclude_packages = set(gen.list_packages(repos=repos, regex=exclude_regex))
+        packages = [_ for _ in packages if _ not in exclude_packages]
+    todo = [_ for _ in packages if _ not in journal.done]
+    print(f"{len(packages)} pkgs selected, {len(packages) - len(todo)} done in an earlier run, {len(todo)} to go")
+    chunk_size = chunk_size or max(8 * jobs, 1)
+    start = time.perf_counter()
+    start_bytes = gen.bytes_downloaded
+    finished = 0
+    try:
+        for i in range(0, len(todo), chunk_size):
+            chunk = todo[i:i + chunk_size]
+            # generate_pkgbuilds takes one repo per call
+            for repo in ["cran", "bioconductor"]:
+                names = [_[0] for _ in chunk if _[1] == repo]
+                if not names:
+                    continue
+                failures = gen.generate_pkgbuilds(
+                    names,
+                    maintainer_github,
+                    maintainer=maintainer,
+                    email=email,
+                    verbose=verbose,
+                    updpkgsums=updpkgsums,
+                    repo=repo,
+                    clean=clean,
+                    destdir=destdir,
+                    jobs=jobs
+                )
+                for name in names:
+                    journal.record(name, repo, failures.get(name))
+            journal.flush()
+            finished += len(chunk)
+            elapsed = time.perf_counter() - start
+            mbytes = (gen.bytes_downloaded - start_bytes) / 1024 ** 2
+            print(f"[{finished}/{len(todo)}] {finished / elapsed:.2f} pkgs/s, {mbytes / elapsed:.2f} MB/s, "
+                  f"{len(journal.failed)} failed")
+    finally:
+        journal.close()
+
+    selected = set(packages)
+    return {key: error for key, error in journal.failed.items() if key in selected}
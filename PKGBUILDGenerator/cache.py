@@ -0,0 +1,343 @@
+import gzip
+import hashlib
+import json
+import os
+import os.path as osp
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+
+import requests
+
+# umask of the process, read once at import, os.umask can only be read by setting it
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+def default_cache_dir():
+    """
+    return the cache dir of this tool, honoring XDG_CACHE_HOME
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or osp.expanduser("~/.cache")
+    return osp.join(cache_home, "pkgbuild-generator-for-r")
+
+
+def atomic_write(filename, data, mode=None):
+    """
+    write bytes `data` to `filename` via a temp file in the same dir and a rename,
+    so readers never see a partially written file, the file is private to the user unless `mode` is given
+    """
+    dirname = osp.dirname(filename) or '.'
+    os.makedirs(dirname, exist_ok=True)
+    fd, tmp_filename = tempfile.mkstemp(
+        dir=dirname, prefix=f".{osp.basename(filename)}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        if mode is not None:
+            os.chmod(tmp_filename, mode)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        os.remove(tmp_filename)
+        raise
+
+
+def copy_file(src_filename, filename):
+    """
+    copy `src_filename` to `filename` via a temp file in the same dir and a rename, streamed, never held in memory,
+    the copy gets the mode a newly created file would get
+    """
+    dirname = osp.dirname(filename) or '.'
+    fd, tmp_filename = tempfile.mkstemp(
+        dir=dirname, prefix=f".{osp.basename(filename)}.")
+    try:
+        with os.fdopen(fd, "wb") as f, open(src_filename, "rb") as src:
+            shutil.copyfileobj(src, f)
+        os.chmod(tmp_filename, 0o666 & ~UMASK)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        os.remove(tmp_filename)
+        raise
+
+
+def write_if_changed(filename, content):
+    """ write str `content` to `filename` atomically, unless the file has this content already
+    an existing file keeps its mode, a new one gets the mode open() would give it
+    return: True if the file was written, False if it was unchanged
+    """
+    data = content.encode("utf-8")
+    try:
+        with open(filename, "rb") as f:
+            if f.read() == data:
+                return False
+            mode = os.fstat(f.fileno()).st_mode & 0o7777
+    except OSError:
+        mode = 0o666 & ~UMASK
+    atomic_write(filename, data, mode=mode)
+    return True
+
+
+class MetadataCache(object):
+    def __init__(self, cache_dir=None, ttl=0, offline=False, session=None):
+        """on-disk cache of repo metadata such as PACKAGES files, revalidated with conditional GET
+        param: cache_dir, cache dir, default: $XDG_CACHE_HOME/pkgbuild-generator-for-r
+        param: ttl, seconds a cached entry is used without revalidation, 0 to always revalidate
+        param: offline, never touch the network, only serve cached entries
+        param: session, requests.Session or MirrorPool to fetch with, default: a new requests.Session
+        """
+        self.cache_dir = osp.join(cache_dir or default_cache_dir(), "metadata")
+        self.ttl = ttl
+        self.offline = offline
+        self.session = session or requests.Session()
+
+    def _entry_filenames(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return osp.join(self.cache_dir, key), osp.join(self.cache_dir, f"{key}.json")
+
+    def _load(self, url):
+        """
+        return (body, meta) cached for `url`, None if not cached
+        """
+        body_filename, meta_filename = self._entry_filenames(url)
+        try:
+            with open(meta_filename, "r") as f:
+                meta = json.load(f)
+            with open(body_filename, "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        return body, meta
+
+    def _store(self, url, body, meta):
+        body_filename, meta_filename = self._entry_filenames(url)
+        atomic_write(body_filename, body)
+        atomic_write(meta_filename, json.dumps(meta).encode("utf-8"))
+
+    def _decode(self, url, body):
+        # some servers send .gz files with `Content-Encoding: gzip` and requests decompresses them already
+        if url.endswith(".gz") and body[:2] == b"\x1f\x8b":
+            body = gzip.decompress(body)
+        return body.decode("utf-8", errors="replace")
+
+    def _remove(self, url):
+        """
+        drop the entry cached for `url` if any, e.g. as it can not be decoded
+        """
+        for filename in self._entry_filenames(url):
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+
+    def fetch_bytes(self, url, headers=None):
+        """ fetch `url` through the cache
+        param: url, url to fetch
+        param: headers, extra request headers, e.g. Authorization, they are not part of the cache key
+        return: body, None if `url` is not found
+        raise: RuntimeError on other failures
+        """
+        cached = self._load(url)
+        if self.offline:
+            if cached is None:
+                return None
+            return cached[0]
+        if cached is not None and self.ttl and time.time() - cached[1]["fetched"] < self.ttl:
+            return cached[0]
+        headers = dict(headers or {})
+        if cached is not None:
+            if cached[1].get("etag"):
+                headers["If-None-Match"] = cached[1]["etag"]
+            if cached[1].get("last_modified"):
+                headers["If-Modified-Since"] = cached[1]["last_modified"]
+        r = self.session.get(url, headers=headers)
+        if r.status_code == requests.codes.not_modified and cached is not None:
+            body, meta = cached
+            meta["fetched"] = time.time()
+            self._store(url, body, meta)
+            return body
+        if r.status_code == requests.codes.ok:
+            meta = {
+                "url": url,
+                "etag": r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+                "fetched": time.time()
+            }
+            self._store(url, r.content, meta)
+            return r.content
+        if r.status_code == requests.codes.not_found:
+            return None
+        raise RuntimeError(
+            f"Failed to get {url} due to: {r.status_code}: {r.reason}")
+
+    def fetch_packages(self, url):
+        """ fetch a PACKAGES file, prefer PACKAGES.gz if the mirror has it
+        param: url, url of the PACKAGES file
+        return: content of the PACKAGES file
+        raise: RuntimeError if neither PACKAGES.gz nor PACKAGES is available, the error of the last one tried if
+            both failed otherwise
+        """
+        candidates = [f"{url}.gz", url]
+        # try the variant we have cached first, so a mirror without PACKAGES.gz costs no extra request
+        candidates.sort(key=lambda _: not osp.exists(self._entry_filenames(_)[1]))
+        error = None
+        for candidate in candidates:
+            # a mirror may fail on one variant only, e.g. a 5xx or a truncated PACKAGES.gz, try the other one then
+            try:
+                body = self.fetch_bytes(candidate)
+            except (OSError, RuntimeError) as e:
+                error = e
+                continue
+            if body is None:
+                continue
+            try:
+                return self._decode(candidate, body)
+            except (OSError, EOFError, zlib.error) as e:
+                error = e
+                # do not try the broken body first again next time
+                self._remove(candidate)
+        if error is not None:
+            raise error
+        if self.offline:
+            raise RuntimeError(f"{url} is not cached, can not fetch it in offline mode")
+        raise RuntimeError(f"Failed to get {url}: not found")
+
+
+class TarballCache(object):
+    def __init__(self, cache_dir=None, max_size=2 * 1024 ** 3):
+        """on-disk cache of source tarballs, keyed by `{repo}/{name}_{version}.tar.gz`
+        each tarball is stored with a `.sha256` sidecar file, which callers verify the tarball against on reuse
+        param: cache_dir, cache dir, default: $XDG_CACHE_HOME/pkgbuild-generator-for-r
+        param: max_size, max total size of cached tarballs in bytes, least recently used ones are evicted first
+        """
+        self.cache_dir = osp.join(cache_dir or default_cache_dir(), "tarballs")
+        self.max_size = max_size
+        # running total size of the cached tarballs, so the cache is only walked when it's over `max_size`
+        self.total_size = sum([_[1] for _ in self.entries()]) if max_size else 0
+        self.lock = threading.Lock()
+
+    def filename(self, repo, tarfilename):
+        return osp.join(self.cache_dir, repo, tarfilename)
+
+    def lookup(self, repo, tarfilename):
+        """
+        return (filename, sha256) of a cached tarball, None if it's not cached
+        """
+        filename = self.filename(repo, tarfilename)
+        try:
+            with open(f"{filename}.sha256", "r") as f:
+                sha256 = f.read().split()[0]
+            # mtime tracks the last use for LRU eviction
+            os.utime(filename)
+        except (OSError, IndexError):
+            return None
+        return filename, sha256
+
+    def invalidate(self, repo, tarfilename):
+        filename = self.filename(repo, tarfilename)
+        with self.lock:
+            self.remove(filename)
+
+    def remove(self, filename):
+        """
+        remove a cached tarball and its sidecar, the caller holds `lock`
+        """
+        try:
+            self.total_size -= os.path.getsize(filename)
+        except OSError:
+            pass
+        for _ in [f"{filename}.sha256", filename]:
+            try:
+                os.remove(_)
+            except FileNotFoundError:
+                pass
+
+    def writer(self, repo, tarfilename):
+        """
+        return a writable temp file for a tarball that is going to be added by `commit`
+        """
+        dirname = osp.dirname(self.filename(repo, tarfilename))
+        os.makedirs(dirname, exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=dirname, prefix=f".{tarfilename}.", delete=False)
+
+    def commit(self, writer, repo, tarfilename, sha256):
+        """
+        add the tarball written to `writer` to the cache, then evict other tarballs beyond `max_size`,
+        the committed one is kept even if it's larger than `max_size` on its own
+        """
+        writer.close()
+        filename = self.filename(repo, tarfilename)
+        size = os.path.getsize(writer.name)
+        with self.lock:
+            try:
+                # a tarball replaced on the mirror replaces the cached one
+                self.total_size -= os.path.getsize(filename)
+            except OSError:
+                pass
+            os.replace(writer.name, filename)
+            atomic_write(f"{filename}.sha256",
+                         f"{sha256}  {tarfilename}\n".encode("utf-8"))
+            self.total_size += size
+            if self.total_size > self.max_size:
+                self.evict(keep=filename)
+
+    def entries(self):
+        """
+        return (mtime, size, filename) of the cached tarballs
+        """
+        entries = []
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if not filename.endswith(".tar.gz") or filename.startswith('.'):
+                    continue
+                filename = osp.join(dirpath, filename)
+                try:
+                    stat = os.stat(filename)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, filename))
+        return entries
+
+    def evict(self, keep=None):
+        """
+        remove least recently used tarballs but `keep` until the cache fits in `max_size`, the caller holds `lock`
+        """
+        entries = self.entries()
+        # recount, other processes may share the cache
+        self.total_size = sum([_[1] for _ in entries])
+        for _, size, filename in sorted(entries):
+            if self.total_size <= self.max_size:
+                break
+            if filename != keep:
+                self.remove(filename)
+
+
+class ManifestCache(object):
+    def __init__(self, cache_dir=None):
+        """on-disk cache of source tarball manifests, see tarball.build_manifest
+        a manifest is keyed by `{repo}/{name}_{version}.tar.gz` and the sha256 of the tarball, so a tarball is
+        decompressed once, a manifest of a tarball replaced on the mirror is not used
+        param: cache_dir, cache dir, default: $XDG_CACHE_HOME/pkgbuild-generator-for-r
+        """
+        self.cache_dir = osp.join(cache_dir or default_cache_dir(), "manifests")
+
+    def filename(self, repo, tarfilename):
+        return osp.join(self.cache_dir, repo, f"{tarfilename}.json")
+
+    def lookup(self, repo, tarfilename, sha256):
+        """
+        return the manifest of a tarball with this sha256, None if it's not cached
+        """
+        try:
+            with open(self.filename(repo, tarfilename), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("sha256") != sha256:
+            return None
+        return entry.get("manifest")
+
+    def store(self, repo, tarfilename, sha256, manifest):
+        atomic_write(self.filename(repo, tarfilename), json.dumps(
+            {"sha256": sha256, "manifest": manifest}).encode("utf-8"))
@@ -0,0 +1,58 @@
+import http.client
+import json
+import socket
+import urllib.parse
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class RemoteGenerator(object):
+    def __init__(self, address, timeout=None):
+        """client of a PKGBUILDGenerator served by server.serve, methods are called like on PKGBUILDGenerator
+
+        only the standard library is imported, so a client starts without paying for requests or the indexes,
+        args are passed by keyword only, results come back as JSON, e.g. exceptions in failures become their messages
+        param: address, `unix:/path/to/socket`, `host:port` or `http://host:port` of the server
+        param: timeout, seconds to wait for a reply, default: no limit, generating pkgs may take long
+        """
+        if address.startswith("unix:"):
+            self.connection = UnixHTTPConnection(address[len("unix:"):], timeout=timeout)
+        else:
+            netloc = urllib.parse.urlsplit(address).netloc if "//" in address else address
+            self.connection = http.client.HTTPConnection(netloc, timeout=timeout)
+
+    def request(self, method, path, body=None):
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        self.connection.request(method, path, body=body, headers=headers)
+        r = self.connection.getresponse()
+        reply = json.loads(r.read())
+        if r.status != 200:
+            raise RuntimeError(f"server failed: {reply.get('error')}")
+        return reply
+
+    def health(self):
+        """
+        return status of the server: number of pkgs of each index, time of the last index refresh and uptime
+        """
+        return self.request("GET", "/health")
+
+    def __getattr__(self, method):
+        if method.startswith('_'):
+            raise AttributeError(method)
+
+        def call(*args, **kwargs):
+            if args:
+                raise TypeError(f"{method} of a remote generator takes keyword args only")
+            return self.request("POST", f"/{method}", json.dumps(kwargs))["result"]
+
+        return call
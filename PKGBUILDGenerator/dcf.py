@@ -0,0 +1,98 @@
+DEPENDENCY_FIELDS = ("Depends", "Imports", "LinkingTo", "Suggests", "Enhances")
+
+
+def parse_dependencies(value):
+    """ split a dependency field such as `Imports: foo (>= 1.0), bar`
+    param: value, value of the field
+    return: list of (name, version constraint or None), e.g. [("foo", ">= 1.0"), ("bar", None)]
+    """
+    dependencies = []
+    for item in value.split(','):
+        name, _, constraint = item.partition('(')
+        name = name.strip()
+        if not name:
+            continue
+        constraint = ' '.join(constraint.rstrip().rstrip(')').split())
+        dependencies.append((name, constraint or None))
+    return dependencies
+
+
+class PackageRecord(object):
+    """one record of a Debian Control File (DCF), i.e. a DESCRIPTION file or an entry of a PACKAGES file
+
+    fields are kept with their case as written, continuation lines are joined with '\\n' after stripping them,
+    the dependency fields are also available pre-split as lists of (name, version constraint or None)
+    """
+    __slots__ = ("fields", "depends", "imports", "linkingto", "suggests", "enhances")
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.depends = parse_dependencies(fields.get("Depends", ""))
+        self.imports = parse_dependencies(fields.get("Imports", ""))
+        self.linkingto = parse_dependencies(fields.get("LinkingTo", ""))
+        self.suggests = parse_dependencies(fields.get("Suggests", ""))
+        self.enhances = parse_dependencies(fields.get("Enhances", ""))
+
+    @property
+    def name(self):
+        return self.fields.get("Package")
+
+    @property
+    def version(self):
+        return self.fields.get("Version")
+
+    def get(self, key, default=None):
+        return self.fields.get(key, default)
+
+    def __getitem__(self, key):
+        return self.fields[key]
+
+    def __contains__(self, key):
+        return key in self.fields
+
+    def __repr__(self):
+        return f"PackageRecord({self.name!r}, {self.version!r})"
+
+
+def iter_fields(text, split_records=True):
+    """
+    yield a field dict per record of DCF `text`, blank lines end a record if `split_records`, they are skipped otherwise
+    """
+    fields = {}
+    key = None
+    for line in text.split('\n'):
+        if not line.strip():
+            if split_records and fields:
+                yield fields
+                fields = {}
+                key = None
+        elif line[0] in " \t":
+            if key is not None:
+                fields[key] += '\n' + line.strip()
+        else:
+            key, sep, value = line.partition(':')
+            if not sep:
+                # not a `key: value` line, ignore it
+                key = None
+                continue
+            fields[key] = value.strip()
+    if fields:
+        yield fields
+
+
+def parse_dcf(text):
+    """ parse DCF `text` in a single pass
+    param: text, content of a PACKAGES file, records are separated by blank lines
+    return: generator of PackageRecord
+    """
+    for fields in iter_fields(text):
+        yield PackageRecord(fields)
+
+
+def parse_dcf_record(text):
+    """ parse DCF `text` holding a single record, e.g. a DESCRIPTION file, stray blank lines are ignored
+    raise: RuntimeError if `text` holds no field
+    """
+    for fields in iter_fields(text, split_records=False):
+        return PackageRecord(fields)
+    raise RuntimeError("no DCF field found")
@@ -0,0 +1,217 @@
+import json
+import os
+import os.path as osp
+import tempfile
+import time
+
+from .cache import UMASK
+
+# fields of a parse_description result exported per pkg, in this order
+FIELDS = (
+    "repo",
+    "subrepo",
+    "rpkgname",
+    "rpkgver",
+    "title",
+    "arch",
+    "r_depends",
+    "r_optdepends",
+    "systemrequirements",
+    "license",
+    "license_filename",
+    "sha256sum"
+)
+# header of the columnar file, see ColumnWriter
+COLUMNS_FORMAT = "pkgbuild-generator-columns-1"
+
+
+def export_record(desc_dict):
+    """
+    return the exported record of a parse_description result, fortran is None if the tarball was not inspected
+    """
+    record = {_: desc_dict[_] for _ in FIELDS}
+    record["fortran"] = "gcc-fortran" in desc_dict["makedepends"] if desc_dict["complete"] else None
+    record["complete"] = desc_dict["complete"]
+    return record
+
+
+def read_export_index(filename):
+    """ index the records of an earlier export by pkg, without loading them
+    return: (rpkgname, repo) -> (rpkgver, complete, offset, length) of its line in `filename`
+    """
+    index = {}
+    if not osp.exists(filename):
+        return index
+    with open(filename, "rb") as f:
+        offset = 0
+        for line in f:
+            try:
+                record = json.loads(line)
+                index[(record["rpkgname"], record["repo"])] = (
+                    record["rpkgver"], record["complete"], offset, len(line))
+            except (ValueError, KeyError):
+                # a line cut short or written by something else, the pkg is exported again
+                pass
+            offset += len(line)
+    return index
+
+
+class ColumnWriter(object):
+    def __init__(self, filename, columns):
+        """columnar copy of the exported records, written as they are produced
+
+        the file is a JSON header line {"format", "rows", "columns"} followed by one line per column holding
+        the JSON array of its values, so a column is loaded by one json.loads, see load_columns
+        values are spooled to one temp file per column until close, no row is kept in memory
+        param: filename, columnar file, it's replaced atomically on close
+        param: columns, names of the columns
+        """
+        self.filename = filename
+        self.columns = columns
+        self.rows = 0
+        self.spools = [tempfile.TemporaryFile("w+", encoding="utf-8") for _ in columns]
+
+    def write(self, record):
+        sep = ',' if self.rows else ''
+        for column, spool in zip(self.columns, self.spools):
+            spool.write(sep + json.dumps(record[column]))
+        self.rows += 1
+
+    def close(self):
+        dirname = osp.dirname(self.filename) or '.'
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp_filename = tempfile.mkstemp(
+            dir=dirname, prefix=f".{osp.basename(self.filename)}.")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"format": COLUMNS_FORMAT, "rows": self.rows, "columns": list(self.columns)}) + '\n')
+                for spool in self.spools:
+                    spool.seek(0)
+                    f.write('[')
+                    while True:
+                        chunk = spool.read(1 << 20)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                    f.write(']\n')
+            os.chmod(tmp_filename, 0o666 & ~UMASK)
+            os.replace(tmp_filename, self.filename)
+        except BaseException:
+            os.remove(tmp_filename)
+            raise
+        finally:
+            self.discard()
+
+    def discard(self):
+        for spool in self.spools:
+            spool.close()
+
+
+def load_columns(filename, columns=None):
+    """ load a columnar file written by export_metadata
+    param: columns, names of the columns to load, default: all, the others are skipped without being parsed
+    return: column name -> list of values, one per pkg
+    """
+    with open(filename, "r", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("format") != COLUMNS_FORMAT:
+            raise RuntimeError(f"{filename} is not a columnar export of pkg metadata")
+        result = {}
+        for column in header["columns"]:
+            line = f.readline()
+            if columns is None or column in columns:
+                result[column] = json.loads(line)
+    return result
+
+
+def export_metadata(
+    gen,
+    filename,
+    columns_filename=None,
+    repos=None,
+    regex=None,
+    exclude_regex=None,
+    metadata_only=False,
+    verbose=False,
+    clean=True,
+    jobs=1,
+    chunk_size=None
+):
+    """ export parsed metadata of all pkgs in the PACKAGES indexes, one JSON record per line, see export_record
+
+    records are written as they are produced, pkgs whose version is the one in the earlier export at `filename`
+    are copied from it instead of being parsed again, the export replaces the earlier one when the run is done
+    args:
+        gen: PKGBUILDGenerator
+        filename: JSONL file to export to
+        columns_filename: also write the records to this columnar file, see ColumnWriter
+        repos, regex, exclude_regex: select pkgs, see generate_bulk
+        metadata_only: export from the PACKAGES indexes only, without fetching tarballs,
+            title, systemrequirements, fortran and sha256sum are then None
+        chunk_size: number of pkgs parsed between two flushes and progress reports, default: 8 * jobs
+        others: see PKGBUILDGenerator.generate_pkgbuilds
+    return: (rpkgname, repo) -> exception, for pkgs that failed, they are left out of the export
+    """
+    packages = gen.list_packages(repos=repos, regex=regex)
+    if exclude_regex:
+        exclude_packages = set(gen.list_packages(repos=repos, regex=exclude_regex))
+        packages = [_ for _ in packages if _ not in exclude_packages]
+    earlier = read_export_index(filename)
+
+    # a record of a complete parse serves a metadata_only export too, not the other way around
+    reused = {key for key in packages if key in earlier and earlier[key][0] == gen.find_record(*key).version
+              and (earlier[key][1] or metadata_only)}
+    print(f"{len(packages)} pkgs selected, {len(reused)} unchanged since the earlier export, "
+          f"{len(packages) - len(reused)} to parse")
+
+    dirname = osp.dirname(filename) or '.'
+    os.makedirs(dirname, exist_ok=True)
+    fd, tmp_filename = tempfile.mkstemp(dir=dirname, prefix=f".{osp.basename(filename)}.")
+    column_writer = ColumnWriter(columns_filename, FIELDS + ("fortran", "complete")) if columns_filename else None
+    earlier_f = open(filename, "rb") if earlier else None
+    failures = {}
+    chunk_size = chunk_size or max(8 * jobs, 1)
+    start = time.perf_counter()
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for i in range(0, len(packages), chunk_size):
+                chunk = packages[i:i + chunk_size]
+                todo = [_ for _ in chunk if _ not in reused]
+                results = dict(zip(todo, gen.map_jobs(
+                    lambda _: gen.parse_description(*_, clean=clean, metadata_only=metadata_only), todo, jobs)))
+                for key in chunk:
+                    if key in results:
+                        desc_dict, error = results[key]
+                        if error is not None:
+                            failures[key] = error
+                            if verbose:
+                                print(f"Failed to parse pkg: {key[0]} ({key[1]}): {error}")
+                            continue
+                        record = export_record(desc_dict)
+                        line = (json.dumps(record) + '\n').encode("utf-8")
+                    else:
+                        offset, length = earlier[key][2:]
+                        earlier_f.seek(offset)
+                        line = earlier_f.read(length).rstrip(b'\n') + b'\n'
+                        record = json.loads(line) if column_writer else None
+                    f.write(line)
+                    if column_writer:
+                        column_writer.write(record)
+                f.flush()
+                finished = min(i + chunk_size, len(packages))
+                print(f"[{finished}/{len(packages)}] {finished / (time.perf_counter() - start):.2f} pkgs/s, "
+                      f"{len(failures)} failed")
+        if column_writer:
+            column_writer.close()
+            column_writer = None
+        os.chmod(tmp_filename, 0o666 & ~UMASK)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        os.remove(tmp_filename)
+        raise
+    finally:
+        if column_writer:
+            column_writer.discard()
+        if earlier_f:
+            earlier_f.close()
+    return failures
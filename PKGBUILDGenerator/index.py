@@ -0,0 +1,209 @@
+import array
+import bisect
+import hashlib
+import mmap
+import os
+import re
+import struct
+
+from .cache import atomic_write
+from .dcf import parse_dcf_record
+
+
+class PackagesIndex(object):
+    def __init__(self, records):
+        """name -> record index over the entries of a PACKAGES file
+        param: records, PackageRecord of each entry of a PACKAGES file
+        the first entry wins if a package is listed more than once, as the old linear scan did
+        """
+        self._records = {}
+        self._names = {}
+        for record in records:
+            name = record.name
+            if name is None:
+                continue
+            self._records.setdefault(name, record)
+            self._names.setdefault(name.lower(), name)
+
+    def __contains__(self, name):
+        return name in self._records
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __len__(self):
+        return len(self._records)
+
+    def get(self, name, ignore_case=False):
+        """
+        return the PackageRecord of `name`, None if not found
+        """
+        if ignore_case:
+            name = self.resolve_name(name)
+        return self._records.get(name)
+
+    def resolve_name(self, name):
+        """
+        map `name` to the pkg name in this index case-insensitively, None if not found
+        """
+        if name in self._records:
+            return name
+        return self._names.get(name.lower())
+
+
+# a record ends at a blank line, lines of whitespace only count as blank like in dcf.iter_fields
+RECORD_SEPARATOR = re.compile(rb"\n(?:[ \t\r]*\n)+")
+PACKAGE_FIELD = re.compile(rb"^Package:[ \t]*(\S+)", re.M)
+SIDECAR_MAGIC = b"PKGIDX01"
+SIDECAR_HEADER = struct.Struct("<8sQQQQ")
+
+
+def name_hash(name):
+    """
+    return a 64-bit hash of pkg name `name`, stable across processes unlike hash()
+    """
+    return int.from_bytes(hashlib.blake2b(name.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class MmapPackagesIndex(object):
+    def __init__(self, filename, sidecar=None):
+        """read-only index over a memory-mapped PACKAGES file, with the interface of PackagesIndex
+
+        only (name hash, offset, length) of each entry is kept in compact arrays, an entry is decoded on first lookup,
+        so processes using the same file share its pages in the page cache and loading it involves no parsing
+        param: filename, PACKAGES file
+        param: sidecar, file to save the arrays to and load them from next time, it's rebuilt if `filename` changed
+        """
+        self.filename = filename
+        with open(filename, "rb") as f:
+            stat = os.fstat(f.fileno())
+            # mmap can not map an empty file
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b""
+        self._stamp = (stat.st_size, stat.st_mtime_ns)
+        self._records = {}
+        if sidecar is None or not self._load_sidecar(sidecar):
+            self._build()
+            if sidecar is not None:
+                self._save_sidecar(sidecar)
+
+    def _build(self):
+        # entries in file order
+        self._offsets = array.array('Q')
+        self._lengths = array.array('Q')
+        hashes = []
+        lower_hashes = []
+        names = set()
+        start = 0
+        ends = [_.start() + 1 for _ in RECORD_SEPARATOR.finditer(self._mm)] + [len(self._mm)]
+        for end in ends:
+            match = PACKAGE_FIELD.search(self._mm, start, end)
+            if match is not None:
+                name = match.group(1).decode("utf-8", errors="replace")
+                self._offsets.append(start)
+                self._lengths.append(end - start)
+                hashes.append(name_hash(name))
+                lower_hashes.append(name_hash(name.lower()))
+                names.add(name)
+            start = end
+        self._len = len(names)
+        # entry numbers sorted by hash, ties in file order so the first entry of a pkg wins as in PackagesIndex
+        self._order = array.array('Q', sorted(range(len(hashes)), key=lambda _: hashes[_]))
+        self._hashes = array.array('Q', [hashes[_] for _ in self._order])
+        self._lower_order = array.array('Q', sorted(range(len(lower_hashes)), key=lambda _: lower_hashes[_]))
+        self._lower_hashes = array.array('Q', [lower_hashes[_] for _ in self._lower_order])
+
+    def _arrays(self):
+        return [self._offsets, self._lengths, self._order, self._hashes, self._lower_order, self._lower_hashes]
+
+    def _load_sidecar(self, sidecar):
+        """
+        load the arrays from `sidecar`, return False if it's missing, broken or made for another version of the file
+        """
+        try:
+            with open(sidecar, "rb") as f:
+                magic, size, mtime_ns, n, n_names = SIDECAR_HEADER.unpack(f.read(SIDECAR_HEADER.size))
+                if magic != SIDECAR_MAGIC or (size, mtime_ns) != self._stamp:
+                    return False
+                arrays = []
+                for _ in range(6):
+                    a = array.array('Q')
+                    a.fromfile(f, n)
+                    arrays.append(a)
+        except (OSError, EOFError, struct.error):
+            return False
+        self._offsets, self._lengths, self._order, self._hashes, self._lower_order, self._lower_hashes = arrays
+        self._len = n_names
+        return True
+
+    def _save_sidecar(self, sidecar):
+        header = SIDECAR_HEADER.pack(SIDECAR_MAGIC, *self._stamp, len(self._offsets), self._len)
+        try:
+            atomic_write(sidecar, header + b"".join([_.tobytes() for _ in self._arrays()]))
+        except OSError:
+            # the sidecar only saves time, e.g. a read-only dir is fine
+            pass
+
+    def _record(self, i):
+        """
+        return PackageRecord of entry `i`, decoded on first use
+        """
+        record = self._records.get(i)
+        if record is None:
+            start = self._offsets[i]
+            text = self._mm[start:start + self._lengths[i]].decode("utf-8", errors="replace")
+            record = parse_dcf_record(text)
+            self._records[i] = record
+        return record
+
+    def _name(self, i):
+        record = self._records.get(i)
+        if record is not None:
+            return record.name
+        start = self._offsets[i]
+        return PACKAGE_FIELD.search(self._mm, start, start + self._lengths[i]).group(1).decode("utf-8", errors="replace")
+
+    def _find(self, name, hashes, order, key):
+        """
+        return number of the first entry whose `key` of name equals `name`, None if not found
+        """
+        h = name_hash(name)
+        i = bisect.bisect_left(hashes, h)
+        while i < len(hashes) and hashes[i] == h:
+            if key(self._name(order[i])) == name:
+                return order[i]
+            i += 1
+        return None
+
+    def __contains__(self, name):
+        return self._find(name, self._hashes, self._order, str) is not None
+
+    def __iter__(self):
+        seen = set()
+        for i in range(len(self._offsets)):
+            name = self._name(i)
+            if name not in seen:
+                seen.add(name)
+                yield name
+
+    def __len__(self):
+        return self._len
+
+    def get(self, name, ignore_case=False):
+        """
+        return the PackageRecord of `name`, None if not found
+        """
+        if ignore_case:
+            name = self.resolve_name(name)
+            if name is None:
+                return None
+        i = self._find(name, self._hashes, self._order, str)
+        return None if i is None else self._record(i)
+
+    def resolve_name(self, name):
+        """
+        map `name` to the pkg name in this index case-insensitively, None if not found
+        """
+        if name in self:
+            return name
+        i = self._find(name.lower(), self._lower_hashes, self._lower_order, str.lower)
+        return None if i is None else self._name(i)
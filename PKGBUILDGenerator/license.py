@@ -0,0 +1,59 @@
+import functools
+
+
+# ordered rules mapping the License field of DESCRIPTION to a license of ArchLinux, the first match wins
+# each rule is (license, substrings, exact values, look for a license file)
+LICENSE_RULES = [
+    ("LGPL", ("LGPL",), ("GNU Lesser General Public License",), False),
+    ("AGPL", ("AGPL",), ("GNU Affero General Public License",), False),
+    ("GPL", ("GNU General Public License", "GPL"), (), False),
+    ("Apache", ("Apache",), (), False),
+    ("BSD", ("BSD",), (), True),
+    ("Artistic2.0", ("Artistic",), (), False),
+    ("CCPL:by-nc-sa", ("CC BY",), ("Creative Commons Attribution 4.0 International License",), False),
+    ("MPL", (), ("Mozilla Public License 1.1", "MPL", "MPL-1.1"), False),
+    ("MPL2", (), (
+        "Mozilla Public License 2.0",
+        "Mozilla Public License Version 2.0",
+        "MPL (>= 2)",
+        "MPL (== 2.0)",
+        "MPL (>= 2.0)",
+        "MPL-2.0",
+        "MPL-2.0 | file LICENSE",
+        "MPL (>= 2) | file LICENSE"
+    ), False),
+    ("CPL", ("CPL",), ("Common Public License Version 1.0",), False),
+    ("MIT", ("MIT",), (), True),
+    ("EPL", ("EPL",), (), False),
+    ("CeCILL", ("CeCILL",), (), True),
+    ("EUPL", ("EUPL",), (), True),
+    ("ACM", ("ACM",), (), True),
+    ("BSL", ("BSL",), (), True),
+    ("CC0", ("CC0",), (), True),
+    ("Lucent Public License", ("Lucent Public License",), (), True),
+    ("Unlimited", ("Unlimited",), (), True),
+]
+
+
+def license_filename(license_field):
+    """
+    return the license file named in the License field, e.g. `MIT + file LICENSE`, None if there is none
+    """
+    filename = None
+    if "file LICENSE" in license_field:
+        filename = "LICENSE"
+    if "file LICENCE" in license_field:
+        filename = "LICENCE"
+    return filename
+
+
+@functools.lru_cache(maxsize=None)
+def classify_license(license_field):
+    """ classify the License field of DESCRIPTION, memoized as there are only a few hundred distinct ones
+    param: license_field, value of the License field
+    return: (license in PKGBUILD, license file to install or None)
+    """
+    for license, substrings, values, with_file in LICENSE_RULES:
+        if license_field in values or any(_ in license_field for _ in substrings):
+            return license, license_filename(license_field) if with_file else None
+    return "custom", license_filename(license_field)
@@ -0,0 +1,215 @@
+import concurrent.futures
+import math
+import threading
+import time
+
+import requests
+
+
+class MirrorGroup(object):
+    def __init__(self, mirrors, probe_path):
+        """mirrors of one repo, e.g. CRAN, ranked by probed latency
+        param: mirrors, mirror urls, the first one is the primary, urls of the generator are built from it
+        param: probe_path, path of a file every mirror of the repo has, e.g. src/contrib/PACKAGES
+        """
+        self.mirrors = [_.rstrip('/') for _ in mirrors]
+        self.probe_path = probe_path
+        # mirror -> seconds to response headers of the probe, inf if it failed
+        self.latencies = {}
+        # mirror -> time.monotonic() of its last failure, a failed mirror is probed again after a while
+        self.failed = {}
+        self.lock = threading.Lock()
+
+    def fail(self, mirror):
+        """
+        rank `mirror` last until it's probed again
+        """
+        self.latencies[mirror] = math.inf
+        self.failed[mirror] = time.monotonic()
+
+    def ranked(self):
+        """
+        return mirrors sorted by latency, unprobed and failed ones last, in the order they were given
+        """
+        return sorted(self.mirrors, key=lambda _: self.latencies.get(_, math.inf))
+
+
+class MirrorPool(object):
+    def __init__(self, session, groups, hedge_delay=1.0, probe_timeout=5, semaphore=None, retry_after=300):
+        """session-like object spreading requests to a repo over its mirrors, with `get` like requests.Session.get
+
+        mirrors of a group are probed on first use, requests go to the fastest mirror, a request to the next mirror is
+        started if there is no response after `hedge_delay` seconds, the first good response wins,
+        a 404 (mirror not synced yet), 5xx or connection error fails over to the next mirror
+        param: session, requests.Session sending the requests
+        param: groups, list of MirrorGroup, urls under no mirror of a group are sent as they are
+        param: hedge_delay, seconds to wait for a response before racing the next mirror
+        param: probe_timeout, seconds to wait for the response of a probe
+        param: retry_after, seconds after which a failed mirror is probed again, in the background
+        param: semaphore, function returning the semaphore limiting concurrent requests to the host of a url,
+            it's taken for every request sent, hedged and failover ones included, default: no limit
+        """
+        self.session = session
+        self.groups = groups
+        self.hedge_delay = hedge_delay
+        self.probe_timeout = probe_timeout
+        self.semaphore = semaphore
+        self.retry_after = retry_after
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(8, 4 * max([len(_.mirrors) for _ in groups] + [1])),
+            thread_name_prefix="mirror")
+
+    def match(self, url):
+        """
+        return (group, path of `url` under its primary mirror), (None, None) if `url` is under no primary mirror
+        """
+        for group in self.groups:
+            primary = group.mirrors[0]
+            if url.startswith(primary + '/'):
+                return group, url[len(primary):]
+        return None, None
+
+    def latency(self, group, mirror):
+        """
+        return seconds to response headers of a HEAD request for the probe file of `group` on `mirror`, inf if it failed
+        """
+        start = time.perf_counter()
+        try:
+            with self.session.head(f"{mirror}/{group.probe_path}", timeout=self.probe_timeout,
+                                   allow_redirects=True) as r:
+                if r.status_code != requests.codes.ok:
+                    return math.inf
+        except requests.RequestException:
+            return math.inf
+        return time.perf_counter() - start
+
+    def probe(self, group):
+        """
+        measure the latency of every mirror of `group` once, concurrently,
+        mirrors failed more than `retry_after` seconds ago are probed again in the background
+        """
+        with group.lock:
+            if not group.latencies:
+                for mirror, latency in zip(group.mirrors, self.executor.map(
+                        lambda _: self.latency(group, _), group.mirrors)):
+                    group.latencies[mirror] = latency
+                    if latency == math.inf:
+                        group.failed[mirror] = time.monotonic()
+                return
+            now = time.monotonic()
+            for mirror, failed in list(group.failed.items()):
+                if now - failed >= self.retry_after:
+                    # not probed again until this probe is done and `retry_after` has passed once more
+                    group.failed[mirror] = now
+                    self.executor.submit(self.reprobe, group, mirror)
+
+    def reprobe(self, group, mirror):
+        latency = self.latency(group, mirror)
+        with group.lock:
+            if latency == math.inf:
+                group.fail(mirror)
+            else:
+                group.latencies[mirror] = latency
+                group.failed.pop(mirror, None)
+
+    def latencies(self):
+        """
+        return mirror -> probed latency in seconds of all probed mirrors, inf for unhealthy ones
+        """
+        return {mirror: latency for group in self.groups for mirror, latency in group.latencies.items()}
+
+    def send(self, url, cancelled=None, **kwargs):
+        """ GET `url` holding the semaphore of its host, until the response is closed for a streamed one
+        param: cancelled, threading.Event, the request is not sent if it's set once the semaphore is taken
+        return: requests.Response, None if it was cancelled
+        """
+        semaphore = self.semaphore(url) if self.semaphore else None
+        if semaphore is None:
+            return self.session.get(url, **kwargs)
+        semaphore.acquire()
+        try:
+            if cancelled is not None and cancelled.is_set():
+                semaphore.release()
+                return None
+            r = self.session.get(url, **kwargs)
+        except BaseException:
+            semaphore.release()
+            raise
+        if not kwargs.get("stream"):
+            # the body is read already
+            semaphore.release()
+            return r
+        close = r.close
+        released = []
+
+        def close_and_release():
+            close()
+            if not released:
+                released.append(True)
+                semaphore.release()
+
+        r.close = close_and_release
+        return r
+
+    def get(self, url, **kwargs):
+        """ GET `url` from the best mirror serving it, see MirrorPool
+        return: requests.Response, the first good one, or the last failed one if every mirror failed with a HTTP error
+        raise: requests.RequestException if every mirror failed with a connection error
+        """
+        group, path = self.match(url)
+        if group is None or len(group.mirrors) == 1:
+            return self.send(url, **kwargs)
+        self.probe(group)
+        queue = group.ranked()
+        pending = {}
+        # set once there is a winner, so racing requests still waiting for their semaphore are not sent
+        cancelled = threading.Event()
+
+        def launch():
+            mirror = queue.pop(0)
+            pending[self.executor.submit(self.send, f"{mirror}{path}", cancelled, **kwargs)] = mirror
+
+        launch()
+        winner = None
+        response = None
+        error = None
+        while pending and winner is None:
+            done, _ = concurrent.futures.wait(
+                pending, timeout=self.hedge_delay if queue else None,
+                return_when=concurrent.futures.FIRST_COMPLETED)
+            if not done:
+                # the mirror is slow, race the next one
+                launch()
+                continue
+            for future in done:
+                mirror = pending.pop(future)
+                try:
+                    r = future.result()
+                except requests.RequestException as e:
+                    error = e
+                    group.fail(mirror)
+                    continue
+                if winner is not None:
+                    r.close()
+                elif r.status_code == requests.codes.not_found or r.status_code >= 500:
+                    if r.status_code >= 500:
+                        group.fail(mirror)
+                    if response is not None:
+                        response.close()
+                    response = r
+                else:
+                    winner = r
+            if winner is None and not pending and queue:
+                # fail over to the next mirror
+                launch()
+        # responses of the mirrors that lost the race are closed when they arrive
+        cancelled.set()
+        for future in pending:
+            future.add_done_callback(lambda _: _.exception() is None and _.result() is not None and _.result().close())
+        if winner is not None:
+            if response is not None:
+                response.close()
+            return winner
+        if response is not None:
+            return response
+        raise error
@@ -0,0 +1,121 @@
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+
+
+# per-pkg spans that do not nest in each other, their sum is the time spent on a pkg
+PACKAGE_STAGES = ("complete_description", "render", "updpkgsums")
+
+
+class Profiler(object):
+    def __init__(self, enabled=True):
+        """per-stage timers and byte counters of a run, exported as a Chrome trace or a JSONL event log
+        param: enabled, record nothing if False, spans are then no-ops
+        """
+        self.enabled = enabled
+        self.start = time.perf_counter()
+        self.events = []
+        # stage -> [count, seconds, bytes]
+        self.stages = collections.defaultdict(lambda: [0, 0.0, 0])
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, stage, rpkgname=None, **args):
+        """ time the block as a span of `stage`, e.g. `with profiler.span("tarball", "foo") as span:`
+        param: rpkgname, pkg the span belongs to, if any
+        param: args, extra args of the span, set args["bytes"] in the block to count bytes
+        yield: args of the span
+        """
+        if not self.enabled:
+            yield args
+            return
+        start = time.perf_counter()
+        try:
+            yield args
+        except BaseException:
+            args["error"] = True
+            raise
+        finally:
+            end = time.perf_counter()
+            event = {
+                "stage": stage,
+                "rpkgname": rpkgname,
+                "ts": (start - self.start) * 1e6,
+                "dur": (end - start) * 1e6,
+                "tid": threading.get_native_id(),
+                "args": args
+            }
+            with self.lock:
+                self.events.append(event)
+            self.add(stage, end - start, args.get("bytes", 0))
+
+    def add(self, stage, seconds, nbytes=0):
+        """
+        count time and bytes of `stage` that are not a span of their own, e.g. the part of a span spent waiting on I/O
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            totals = self.stages[stage]
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += nbytes
+
+    def chrome_trace(self):
+        """
+        return the events in Chrome trace format, it's loaded by chrome://tracing and https://ui.perfetto.dev
+        """
+        pid = os.getpid()
+        trace_events = []
+        for event in self.events:
+            args = dict(event["args"])
+            name = event["stage"]
+            if event["rpkgname"] is not None:
+                args["rpkgname"] = event["rpkgname"]
+                name = f"{name} {event['rpkgname']}"
+            trace_events.append({
+                "name": name,
+                "cat": event["stage"],
+                "ph": "X",
+                "ts": round(event["ts"], 1),
+                "dur": round(event["dur"], 1),
+                "pid": pid,
+                "tid": event["tid"],
+                "args": args
+            })
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def write(self, filename):
+        """
+        write the events to `filename`, as a JSONL event log if it ends with .jsonl, as a Chrome trace otherwise
+        """
+        with self.lock:
+            events = sorted(self.events, key=lambda _: _["ts"])
+        with open(filename, "w") as f:
+            if filename.endswith(".jsonl"):
+                for event in events:
+                    f.write(json.dumps(event) + '\n')
+            else:
+                json.dump(self.chrome_trace(), f)
+
+    def summary(self, top=10):
+        """
+        return a table of the stages by total time and of the `top` slowest pkgs
+        """
+        lines = [f"{'stage':<20} {'count':>7} {'total s':>9} {'mean ms':>9} {'MB':>9}"]
+        for stage, (count, seconds, nbytes) in sorted(self.stages.items(), key=lambda _: -_[1][1]):
+            lines.append(f"{stage:<20} {count:>7} {seconds:>9.3f} {seconds / count * 1e3:>9.1f} "
+                         f"{nbytes / 1024 ** 2:>9.2f}")
+        package_seconds = collections.Counter()
+        for event in self.events:
+            if event["stage"] in PACKAGE_STAGES and event["rpkgname"] is not None:
+                package_seconds[event["rpkgname"]] += event["dur"] / 1e6
+        if package_seconds:
+            lines.append("")
+            lines.append(f"{'slowest pkgs':<30} {'total s':>9}")
+            for rpkgname, seconds in package_seconds.most_common(top):
+                lines.append(f"{rpkgname:<30} {seconds:>9.3f}")
+        return '\n'.join(lines)
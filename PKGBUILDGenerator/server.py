@@ -0,0 +1,150 @@
+import http.server
+import inspect
+import json
+import os
+import socketserver
+import threading
+import time
+import traceback
+
+
+# generator methods served, POST /<method> with their keyword args as a JSON object
+METHODS = (
+    "generate_pkgbuilds",
+    "update_pkgbuilds",
+    "rebuild_plan",
+    "get_rpkgname",
+    "get_cran_ver",
+    "get_bioconductor_ver",
+    "get_github_ver",
+    "list_packages"
+)
+
+
+def to_json(obj):
+    """
+    return `obj` as JSON bytes, exceptions in results, e.g. failures of generate_pkgbuilds, become their messages
+    """
+    return json.dumps(obj, default=str).encode("utf-8")
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    # keep connections of a client open between requests
+    protocol_version = "HTTP/1.1"
+
+    def address_string(self):
+        # a Unix socket has no client address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def reply(self, status, obj):
+        body = to_json(obj)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self.reply(404, {"error": f"unknown path: {self.path}"})
+            return
+        gen = self.server.gen
+        self.reply(200, {
+            "indexes": {repo: len(index) for repo, index in gen.indexes.items()},
+            "refreshed": self.server.refreshed,
+            "uptime": time.time() - self.server.started
+        })
+
+    def do_POST(self):
+        method = self.path.strip('/')
+        if method not in METHODS:
+            self.reply(404, {"error": f"unknown method: {method}, expected one of {list(METHODS)}"})
+            return
+        try:
+            kwargs = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except ValueError as e:
+            self.reply(400, {"error": f"invalid JSON: {e}"})
+            return
+        func = getattr(self.server.gen, method)
+        try:
+            inspect.signature(func).bind(**kwargs)
+        except TypeError as e:
+            self.reply(400, {"error": f"{method}: {e}"})
+            return
+        try:
+            result = func(**kwargs)
+        except Exception as e:
+            if self.server.verbose:
+                traceback.print_exc()
+            self.reply(500, {"error": str(e)})
+            return
+        self.reply(200, {"result": result})
+
+
+class GeneratorServerMixin(object):
+    daemon_threads = True
+
+    def setup_generator(self, gen, refresh_interval, verbose):
+        """
+        serve `gen`, reloading its PACKAGES indexes every `refresh_interval` seconds in a background thread
+        """
+        self.gen = gen
+        self.verbose = verbose
+        self.started = time.time()
+        self.refreshed = None
+        # warm up, so the first request does not pay for loading the indexes
+        gen.list_packages()
+        self.refreshed = time.time()
+        if refresh_interval:
+            thread = threading.Thread(target=self.refresh_loop, args=(refresh_interval,), daemon=True)
+            thread.start()
+
+    def refresh_loop(self, refresh_interval):
+        while True:
+            time.sleep(refresh_interval)
+            try:
+                self.gen.refresh_indexes()
+                self.refreshed = time.time()
+            except Exception as e:
+                # keep serving the indexes loaded before
+                print(f"Failed to refresh PACKAGES indexes: {e}")
+
+
+class GeneratorHTTPServer(GeneratorServerMixin, http.server.ThreadingHTTPServer):
+    pass
+
+
+class GeneratorUnixServer(GeneratorServerMixin, socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    pass
+
+
+def serve(gen, address, refresh_interval=3600, verbose=False):
+    """ serve PKGBUILDGenerator `gen` until interrupted, see client.RemoteGenerator for the client side
+    args:
+        gen: PKGBUILDGenerator to keep warm
+        address: `unix:/path/to/socket` or `host:port`, a TCP server should listen on localhost only
+        refresh_interval: seconds between reloads of the PACKAGES indexes, 0 to never reload them
+        verbose: log requests
+    """
+    if address.startswith("unix:"):
+        path = address[len("unix:"):]
+        if os.path.exists(path):
+            os.remove(path)
+        server = GeneratorUnixServer(path, RequestHandler)
+    else:
+        host, _, port = address.rpartition(':')
+        server = GeneratorHTTPServer((host or "127.0.0.1", int(port)), RequestHandler)
+    with server:
+        server.setup_generator(gen, refresh_interval, verbose)
+        print(f"serving on {address}", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if address.startswith("unix:"):
+                os.remove(address[len("unix:"):])
@@ -0,0 +1,114 @@
+import hashlib
+import tarfile
+import time
+
+
+# compiled languages of src files by file suffix, see build_manifest
+LANGUAGE_SUFFIXES = {
+    "C": (".c",),
+    "C++": (".cc", ".cpp", ".cxx"),
+    "Fortran": (".f", ".f90", ".for"),
+    "Rust": (".rs",)
+}
+
+
+class StreamReader(object):
+    def __init__(self, fileobj, tee=None):
+        """read-only file object over a download stream, it hashes and counts everything read
+        param: fileobj, stream to read from, e.g. the raw stream of a HTTP response
+        param: tee, optional writable file object that gets a copy of everything read
+        """
+        self.fileobj = fileobj
+        self.tee = tee
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        # seconds spent waiting on `fileobj`, i.e. on the network for a download stream
+        self.read_time = 0.0
+
+    def read(self, size=-1):
+        start = time.perf_counter()
+        data = self.fileobj.read(size)
+        self.read_time += time.perf_counter() - start
+        if data:
+            self.hasher.update(data)
+            self.size += len(data)
+            if self.tee is not None:
+                self.tee.write(data)
+        return data
+
+    def sha256(self):
+        """
+        return hex sha256 of everything read so far
+        """
+        return self.hasher.hexdigest()
+
+    def drain(self, chunk_size=64 * 1024):
+        """
+        read the stream up to its end, so that `tee` gets the whole file
+        """
+        while self.read(chunk_size):
+            pass
+
+
+def inspect_tarball(fileobj, desc_filename):
+    """ scan a gzipped source tarball in one streaming pass, see build_manifest
+    args:
+        fileobj: file object to read the tarball from, it's read sequentially only
+        desc_filename: member name of the DESCRIPTION file, e.g. `pkgname/DESCRIPTION`
+    return: manifest of the tarball, see build_manifest
+    raise: RuntimeError if DESCRIPTION is not found
+    """
+    description = None
+    members = []
+    with tarfile.open(fileobj=fileobj, mode="r|gz") as f:
+        for member in f:
+            members.append(member.name)
+            if member.name == desc_filename and member.isfile():
+                data = f.extractfile(member).read()
+                try:
+                    description = data.decode("utf-8")
+                except UnicodeDecodeError:
+                    # DESCRIPTION files may declare `Encoding: latin1`
+                    description = data.decode("latin-1")
+    if description is None:
+        raise RuntimeError(f"{desc_filename} not found in source tarball")
+    return build_manifest(members, desc_filename.split('/')[0], description)
+
+
+def build_manifest(members, pkgname, description):
+    """ summarize the members of a source tarball, it's what the generator needs to know about its content
+    args:
+        members: member names, e.g. `pkgname/src/init.c`
+        pkgname: top-level dir of the tarball
+        description: content of DESCRIPTION
+    return: dict of
+        members: member names, in tarball order
+        languages: sorted compiled languages of src files under src/, see LANGUAGE_SUFFIXES
+        configure: True if there is a configure script
+        makevars: True if there is src/Makevars or src/Makevars.in
+        license_files: sorted names of top-level LICENSE/LICENCE files
+        description: content of DESCRIPTION
+    """
+    languages = set()
+    license_files = set()
+    src_prefix = f"{pkgname}/src/"
+    for name in members:
+        if name.startswith(src_prefix):
+            for language, suffixes in LANGUAGE_SUFFIXES.items():
+                if name.endswith(suffixes):
+                    languages.add(language)
+            if name.endswith("/Cargo.toml"):
+                languages.add("Rust")
+        else:
+            dirname, _, basename = name.rpartition('/')
+            if dirname == pkgname and basename.startswith(("LICENSE", "LICENCE")):
+                license_files.add(basename)
+    names = set(members)
+    return {
+        "members": members,
+        "languages": sorted(languages),
+        "configure": f"{pkgname}/configure" in names,
+        "makevars": f"{src_prefix}Makevars" in names or f"{src_prefix}Makevars.in" in names,
+        "license_files": sorted(license_files),
+        "description": description
+    }
@@ -0,0 +1,136 @@
+import re
+
+
+# scalars PyYAML would resolve to something other than str, they must be quoted to stay strings
+IMPLICIT_RESOLVERS = re.compile(r'''^(?:
+    yes|Yes|YES|no|No|NO|true|True|TRUE|false|False|FALSE|on|On|ON|off|Off|OFF
+    |~|null|Null|NULL|<<|=
+    |[-+]?(?:[0-9][0-9_]*)\.[0-9_]*(?:[eE][-+][0-9]+)?
+    |\.[0-9][0-9_]*(?:[eE][-+][0-9]+)?
+    |[-+]?[0-9][0-9_]*(?::[0-5]?[0-9])+\.[0-9_]*
+    |[-+]?\.(?:inf|Inf|INF)|\.(?:nan|NaN|NAN)
+    |[-+]?0b[0-1_]+|[-+]?0[0-7_]+|[-+]?(?:0|[1-9][0-9_]*)|[-+]?0x[0-9a-fA-F_]+
+    |[-+]?[1-9][0-9_]*(?::[0-5]?[0-9])+
+    |[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]
+    |[0-9][0-9][0-9][0-9]-[0-9][0-9]?-[0-9][0-9]?(?:[Tt]|[\ \t]+)[0-9][0-9]?:[0-9][0-9]:[0-9][0-9]
+        (?:\.[0-9]*)?(?:[\ \t]*(?:Z|[-+][0-9][0-9]?(?::[0-9][0-9])?))?
+)$''', re.X)
+
+
+# escapes of PyYAML's double-quoted scalars, other characters are escaped as \xXX, \uXXXX or \UXXXXXXXX
+ESCAPE_REPLACEMENTS = {
+    '\0': '0',
+    '\x07': 'a',
+    '\x08': 'b',
+    '\x09': 't',
+    '\x0A': 'n',
+    '\x0B': 'v',
+    '\x0C': 'f',
+    '\x0D': 'r',
+    '\x1B': 'e',
+    '"': '"',
+    '\\': '\\',
+    '\x85': 'N',
+    '\xA0': '_',
+    '\u2028': 'L',
+    '\u2029': 'P'
+}
+
+
+def is_plain_safe(value):
+    """
+    return True if str `value` can be written as a plain scalar in block context,
+    following the rules of PyYAML's emitter
+    """
+    # safe_dump does not allow unicode, non-ASCII strings are double-quoted with escapes
+    if not value or value != value.strip() or not value.isascii() or not value.isprintable():
+        return False
+    if IMPLICIT_RESOLVERS.match(value) or value.startswith(("---", "...")):
+        return False
+    if value[0] in "#,[]{}&*!|>'\"%@`":
+        return False
+    if value[0] in "-?" and (len(value) == 1 or value[1] == ' '):
+        return False
+    if ": " in value or " #" in value or value.endswith(':'):
+        return False
+    return True
+
+
+def double_quoted(value):
+    """
+    return str `value` as a double-quoted scalar escaped like PyYAML does without allow_unicode
+    """
+    chars = []
+    for ch in value:
+        if ch in ESCAPE_REPLACEMENTS:
+            chars.append('\\' + ESCAPE_REPLACEMENTS[ch])
+        elif ' ' <= ch <= '~':
+            chars.append(ch)
+        elif ch <= '\xFF':
+            chars.append(f"\\x{ord(ch):02X}")
+        elif ch <= '\uFFFF':
+            chars.append(f"\\u{ord(ch):04X}")
+        else:
+            chars.append(f"\\U{ord(ch):08X}")
+    return '"' + ''.join(chars) + '"'
+
+
+def scalar(value):
+    """
+    return `value` as a YAML scalar, quoted the way prettier formats PyYAML's output
+    """
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return str(value)
+    if is_plain_safe(value):
+        return value
+    if not value.isascii() or not value.isprintable():
+        # PyYAML double-quotes these, prettier keeps the escapes
+        return double_quoted(value)
+    # prettier turns single quotes into double quotes unless that needs escapes
+    if '\\' in value or '"' in value:
+        return "'" + value.replace("'", "''") + "'"
+    return f'"{value}"'
+
+
+def dump_lines(obj, indent=0):
+    pad = ' ' * indent
+    lines = []
+    if isinstance(obj, dict):
+        for key in sorted(obj):
+            value = obj[key]
+            if isinstance(value, (dict, list)) and value:
+                lines.append(f"{pad}{scalar(key)}:")
+                lines += dump_lines(value, indent + 2)
+            else:
+                lines.append(f"{pad}{scalar(key)}: {dump_flow(value)}")
+    else:
+        for item in obj:
+            if isinstance(item, (dict, list)) and item:
+                item_lines = dump_lines(item, indent + 2)
+                lines.append(f"{pad}- {item_lines[0].lstrip()}")
+                lines += item_lines[1:]
+            else:
+                lines.append(f"{pad}- {dump_flow(item)}")
+    return lines
+
+
+def dump_flow(value):
+    if isinstance(value, dict):
+        return "{}"
+    if isinstance(value, list):
+        return "[]"
+    return scalar(value)
+
+
+def dump_yaml(obj):
+    """
+    return YAML document of dict `obj`, byte-identical to `yaml.safe_dump(obj)` formatted by `prettier`:
+    keys sorted, sequences indented by 2 spaces, double quotes preferred for quoted strings,
+    except for strings with line breaks, which are double-quoted with escapes instead of folded, and for strings
+    longer than PyYAML's line width, which are not wrapped
+    """
+    return '\n'.join(dump_lines(obj)) + '\n'
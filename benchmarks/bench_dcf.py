@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+benchmark parsing a PACKAGES file: configparser per entry (the old path) against the single-pass DCF parser,
+and loading the memory-mapped offset index of it, built from scratch and from its sidecar
+a synthetic CRAN-sized PACKAGES file is used unless one is given, e.g. https://cran.r-project.org/src/contrib/PACKAGES
+"""
+import argparse
+import configparser
+import os.path as osp
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, osp.dirname(osp.dirname(osp.abspath(__file__))))
+from PKGBUILDGenerator.dcf import parse_dcf  # noqa: E402
+from PKGBUILDGenerator.index import MmapPackagesIndex  # noqa: E402
+
+
+def synthetic_packages(n, seed=0, prefix="pkg"):
+    """
+    return a PACKAGES file of `n` entries shaped like CRAN's, named `prefix`0, `prefix`1, ...
+    """
+    rng = random.Random(seed)
+    names = [f"{prefix}{i}" for i in range(n)]
+    entries = []
+    for i, name in enumerate(names):
+        deps = rng.sample(names[:i], min(i, rng.randint(0, 8)))
+        lines = [
+            f"Package: {name}",
+            f"Version: {rng.randint(0, 3)}.{rng.randint(0, 20)}-{rng.randint(0, 9)}",
+            "Depends: R (>= 3.5.0)"
+        ]
+        if deps:
+            imports = ", ".join([f"{_} (>= 1.{rng.randint(0, 9)})" for _ in deps])
+            lines.append(f"Imports: {imports[:60]}")
+            if len(imports) > 60:
+                lines.append(f"        {imports[60:]}")
+        if i and rng.random() < 0.3:
+            # deps only point to earlier entries, so the dependency graph is acyclic like CRAN's
+            lines.append(f"LinkingTo: {rng.choice(names[:i])}")
+        lines.append("Suggests: knitr, rmarkdown, testthat (>= 3.0.0)")
+        lines.append(rng.choice(["License: GPL (>= 2)", "License: MIT + file LICENSE", "License: GPL-3"]))
+        lines.append(f"MD5sum: {rng.getrandbits(128):032x}")
+        lines.append(f"NeedsCompilation: {rng.choice(['yes', 'no'])}")
+        entries.append('\n'.join(lines))
+    return '\n\n'.join(entries) + '\n'
+
+
+def parse_configparser(text):
+    records = {}
+    for desc in text.split('\n\n'):
+        if not desc.startswith("Package: "):
+            continue
+        name = desc.split('\n', 1)[0][len("Package: "):].strip()
+        config = configparser.ConfigParser()
+        config.read_string(f"[{name}]\n" + desc)
+        records[name] = config[name]
+    return records
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--packages-file", type=str,
+                        help="PACKAGES file to parse, default: a synthetic one")
+    parser.add_argument("-n", type=int, default=21000,
+                        help="number of entries of the synthetic PACKAGES file, default: 21000")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+    if args.packages_file:
+        with open(args.packages_file, 'r') as f:
+            text = f.read()
+    else:
+        text = synthetic_packages(args.n)
+
+    start = time.perf_counter()
+    old_records = parse_configparser(text)
+    old_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    new_records = {_.name: _ for _ in parse_dcf(text)}
+    new_elapsed = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        packages_file = osp.join(tmpdir, "PACKAGES")
+        with open(packages_file, 'w') as f:
+            f.write(text)
+        sidecar = osp.join(tmpdir, "PACKAGES.idx")
+        start = time.perf_counter()
+        MmapPackagesIndex(packages_file, sidecar=sidecar)
+        mmap_elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        index = MmapPackagesIndex(packages_file, sidecar=sidecar)
+        sidecar_elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        for name in new_records:
+            index.get(name)
+        lookup_elapsed = time.perf_counter() - start
+
+    print(f"{len(new_records)} entries, {len(text) / 1024 ** 2:.1f} MB")
+    print(f"configparser: {old_elapsed:8.3f} s")
+    print(f"parse_dcf:    {new_elapsed:8.3f} s ({old_elapsed / new_elapsed:.1f}x faster)")
+    print(f"mmap index:   {mmap_elapsed:8.3f} s, {sidecar_elapsed:.4f} s from its sidecar, "
+          f"first lookup of every entry {lookup_elapsed:.3f} s")
+    mismatches = [_ for _ in new_records
+                  if _ not in old_records or old_records[_].get("version") != new_records[_].version]
+    if mismatches:
+        print(f"versions differ for {len(mismatches)} entries, e.g. {mismatches[0]}")
+        sys.exit(1)
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+benchmark PKGBUILDGenerator end to end against a local stand-in mirror
+
+a CRAN/Bioconductor mirror is served from a temp dir by an HTTP server in a child process, with synthetic PACKAGES
+files of 20k+ entries and generated source tarballs of varying sizes, so runs need no network and are comparable
+each stage is timed `--repeat` times and run once more under tracemalloc for its peak memory, the results of a run
+are appended as one JSON line to `--output`, to compare runs over time
+"""
+import argparse
+import datetime
+import functools
+import gzip
+import http.server
+import io
+import json
+import multiprocessing
+import os
+import os.path as osp
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, osp.dirname(osp.dirname(osp.abspath(__file__))))
+from bench_dcf import synthetic_packages  # noqa: E402
+from PKGBUILDGenerator.dcf import parse_dcf  # noqa: E402
+from PKGBUILDGenerator.PKGBUILDGenerator import PKGBUILDGenerator  # noqa: E402
+
+# size of the data file in generated tarballs and its weight, most pkgs are small, a few are large
+TARBALL_SIZES = [(1024, 40), (32 * 1024, 35), (256 * 1024, 20), (2 * 1024 ** 2, 5)]
+
+
+def shape_packages(depth, width):
+    """ PACKAGES entries of dependency graphs of known shapes, appended to the synthetic CRAN
+    return: (PACKAGES text, shape -> (root pkg, number of pkgs in its graph))
+    """
+    entries = []
+
+    def add(name, deps):
+        lines = [f"Package: {name}", "Version: 1.0.0", "Depends: R (>= 4.0)"]
+        if deps:
+            lines.append(f"Imports: {', '.join(deps)}")
+        lines += ["License: MIT + file LICENSE", "NeedsCompilation: no"]
+        entries.append('\n'.join(lines))
+
+    # chain: each pkg imports the one before it, one pkg per wave
+    for i in range(depth):
+        add(f"chain{i}", [f"chain{i - 1}"] if i else [])
+    # star: one pkg importing `width` leaves, a single wide wave
+    for i in range(width):
+        add(f"starleaf{i}", [])
+    add("starroot", [f"starleaf{i}" for i in range(width)])
+    # diamond: layers of 4 pkgs, each importing every pkg of the layer below, shared deps everywhere
+    layers = max(depth // 4, 1)
+    for layer in range(layers):
+        for i in range(4):
+            add(f"diamond{layer}x{i}", [f"diamond{layer - 1}x{_}" for _ in range(4)] if layer else [])
+    add("diamondroot", [f"diamond{layers - 1}x{_}" for _ in range(4)])
+
+    shapes = {
+        "chain": (f"chain{depth - 1}", depth),
+        "star": ("starroot", width + 1),
+        "diamond": ("diamondroot", layers * 4 + 1)
+    }
+    return '\n\n'.join(entries) + '\n', shapes
+
+
+def make_tarball(record, rng):
+    """
+    return a source tarball of the PACKAGES `record`, with a DESCRIPTION matching it and a data file of random size
+    """
+    name = record.name
+    description = [f"Package: {name}", f"Title: Synthetic Package {name}",
+                   f"Description: Synthetic package {name} served by the benchmark mirror."]
+    for key, value in record.fields.items():
+        if key not in ("Package", "MD5sum"):
+            description.append(f"{key}: {value}".replace('\n', '\n    '))
+    members = {
+        "DESCRIPTION": '\n'.join(description).encode() + b'\n',
+        f"R/{name}.R": f"{name}_hello <- function() \"hello from {name}\"\n".encode(),
+        "inst/extdata/data.bin": rng.randbytes(rng.choices(*zip(*TARBALL_SIZES))[0])
+    }
+    if record.get("NeedsCompilation") == "yes":
+        members["src/init.c"] = b"void R_init_pkg(void *dll) {}\n"
+        if rng.random() < 0.2:
+            members["src/kernel.f90"] = b"subroutine kernel()\nend subroutine kernel\n"
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for member_name, data in members.items():
+            info = tarfile.TarInfo(f"{name}/{member_name}")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(root, conn):
+    handler = functools.partial(QuietHandler, directory=root)
+    with http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler) as httpd:
+        conn.send(httpd.server_address[1])
+        httpd.serve_forever()
+
+
+class Mirror(object):
+    def __init__(self, root, n_cran, n_bioc, n_annotation, sample_size, depth, width, seed=0):
+        """stand-in CRAN/Bioconductor mirror in `root`, served over HTTP in a child process while used as a context
+        param: n_cran, n_bioc, n_annotation: number of synthetic entries of each PACKAGES file
+        param: sample_size: number of CRAN and of Bioconductor pkgs with a tarball, picked at random
+        param: depth, width: size of the dependency graph shapes, see shape_packages
+        """
+        self.root = root
+        rng = random.Random(seed)
+        shapes_text, self.shapes = shape_packages(depth, width)
+        contents = {
+            "src/contrib": synthetic_packages(n_cran, seed) + '\n' + shapes_text,
+            "packages/release/bioc/src/contrib": synthetic_packages(n_bioc, seed + 1, prefix="bioc"),
+            "packages/release/data/annotation/src/contrib": synthetic_packages(n_annotation, seed + 2, prefix="anno"),
+            "packages/release/data/experiment/src/contrib": ""
+        }
+        self.names = {}
+        self.sample = {}
+        for path, text in contents.items():
+            dirname = osp.join(root, path)
+            os.makedirs(dirname, exist_ok=True)
+            with open(osp.join(dirname, "PACKAGES"), 'w') as f:
+                f.write(text)
+            with gzip.open(osp.join(dirname, "PACKAGES.gz"), 'wt') as f:
+                f.write(text)
+            records = list(parse_dcf(text))
+            self.names[path] = [_.name for _ in records]
+            # only pkgs that get fetched have a tarball, writing 20k+ of them would dominate the setup
+            with_tarball = rng.sample(records, min(sample_size, len(records)))
+            if path == "src/contrib":
+                self.sample["cran"] = [_.name for _ in with_tarball]
+                shape_names = set(_.name for _ in parse_dcf(shapes_text))
+                with_tarball += [_ for _ in records if _.name in shape_names]
+            elif path == "packages/release/bioc/src/contrib":
+                self.sample["bioconductor"] = [_.name for _ in with_tarball]
+            for record in with_tarball:
+                with open(osp.join(dirname, f"{record.name}_{record.version}.tar.gz"), 'wb') as f:
+                    f.write(make_tarball(record, rng))
+        self.url = None
+        self.process = None
+
+    def __enter__(self):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=serve, args=(self.root, child_conn), daemon=True)
+        self.process.start()
+        self.url = f"http://127.0.0.1:{parent_conn.recv()}"
+        return self
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.join()
+
+
+def measure(stage, run, setup=None, repeat=3):
+    """ time `run(setup())` `repeat` times, then run it once more under tracemalloc for its peak memory
+    param: run: function of the setup result, returns the number of operations it did
+    return: result dict of the stage
+    """
+    times = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        ops = run(state)
+        times.append(time.perf_counter() - start)
+    state = setup() if setup else None
+    tracemalloc.start()
+    run(state)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "stage": stage,
+        "ops": ops,
+        "repeat": repeat,
+        "best_s": min(times),
+        "median_s": statistics.median(times),
+        "per_op_us": min(times) / max(ops, 1) * 1e6,
+        "peak_bytes": peak
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=osp.dirname(osp.abspath(__file__)),
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(mirror, workdir, repeat):
+    warm_cache_dir = osp.join(workdir, "cache-warm")
+
+    def new_generator(cache_dir=None, tarball_cache_size=0, load=True):
+        gen = PKGBUILDGenerator(
+            cran_mirror=mirror.url,
+            bioconductor_mirror=mirror.url,
+            cache_dir=cache_dir or warm_cache_dir,
+            cache_ttl=3600,
+            tarball_cache_size=tarball_cache_size
+        )
+        if load:
+            gen.list_packages()
+        return gen
+
+    def fresh_dir():
+        return tempfile.mkdtemp(dir=workdir)
+
+    # fill the warm caches: PACKAGES files and the tarballs of the sample
+    new_generator(tarball_cache_size=2 * 1024 ** 3)
+    cached_gen = new_generator(tarball_cache_size=2 * 1024 ** 3)
+    for rpkgname in mirror.sample["cran"]:
+        cached_gen.parse_description(rpkgname, "cran")
+    loaded_gen = new_generator()
+    cran_names = mirror.names["src/contrib"]
+    bioc_names = mirror.names["packages/release/bioc/src/contrib"] + \
+        mirror.names["packages/release/data/annotation/src/contrib"]
+    sample = mirror.sample["cran"]
+    bioc_sample = mirror.sample["bioconductor"]
+    desc_dicts = [cached_gen.parse_description(_, "cran") for _ in sample]
+    for desc_dict in desc_dicts:
+        desc_dict.update({"maintainer": "bench", "email": "bench@localhost", "maintainer_github": "bench"})
+
+    results = []
+
+    def run_init(cache_dir):
+        new_generator(cache_dir=cache_dir)
+        return 1
+
+    results.append(measure("init", run_init, setup=fresh_dir, repeat=repeat))
+    results.append(measure("init_cached", run_init, setup=lambda: warm_cache_dir, repeat=repeat))
+
+    def run_lookups(lookup, names):
+        for name in names:
+            lookup(name)
+        return len(names)
+
+    results.append(measure(
+        "get_cran_ver", lambda _: run_lookups(loaded_gen.get_cran_ver, cran_names), repeat=repeat))
+    results.append(measure(
+        "get_cran_ver_ignore_case",
+        lambda _: run_lookups(functools.partial(loaded_gen.get_cran_ver, ignore_case=True),
+                              [_.upper() for _ in cran_names]),
+        repeat=repeat))
+    results.append(measure(
+        "get_bioconductor_ver", lambda _: run_lookups(loaded_gen.get_bioconductor_ver, bioc_names), repeat=repeat))
+    results.append(measure(
+        "get_rpkgname",
+        lambda _: run_lookups(loaded_gen.get_rpkgname, [f"r-{_.lower()}" for _ in cran_names + bioc_names]),
+        repeat=repeat))
+
+    def run_parse(gen, rpkgnames, repo, metadata_only=False):
+        for rpkgname in rpkgnames:
+            gen.parse_description(rpkgname, repo, metadata_only=metadata_only)
+        return len(rpkgnames)
+
+    results.append(measure(
+        "parse_description", lambda gen: run_parse(gen, sample, "cran"),
+        setup=new_generator, repeat=repeat))
+    results.append(measure(
+        "parse_description_bioconductor", lambda gen: run_parse(gen, bioc_sample, "bioconductor"),
+        setup=new_generator, repeat=repeat))
+    results.append(measure(
+        "parse_description_cached", lambda gen: run_parse(gen, sample, "cran"),
+        setup=lambda: new_generator(tarball_cache_size=2 * 1024 ** 3), repeat=repeat))
+    results.append(measure(
+        "parse_description_metadata_only", lambda gen: run_parse(gen, sample, "cran", metadata_only=True),
+        setup=new_generator, repeat=repeat))
+
+    def run_write(destdir):
+        for i, desc_dict in enumerate(desc_dicts):
+            loaded_gen.write_pkgbuild(osp.join(destdir, f"PKGBUILD.{i}"), desc_dict)
+        return len(desc_dicts)
+
+    results.append(measure("write_pkgbuild", run_write, setup=fresh_dir, repeat=repeat))
+
+    for shape, (root, size) in mirror.shapes.items():
+        def run_recursive(state):
+            gen, destdir = state
+            gen.generate_pkgbuild(
+                root, "bench", recursive=True, maintainer="bench", email="bench@localhost", destdir=destdir)
+            return size
+
+        results.append(measure(
+            f"generate_pkgbuild_recursive[{shape}]", run_recursive,
+            setup=lambda: (new_generator(), fresh_dir()), repeat=repeat))
+    return results
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cran", type=int, default=21000,
+                        help="number of entries of the synthetic CRAN PACKAGES file, default: 21000")
+    parser.add_argument("--bioc", type=int, default=2300,
+                        help="number of entries of the synthetic Bioconductor software PACKAGES file, default: 2300")
+    parser.add_argument("--annotation", type=int, default=900,
+                        help="number of entries of the synthetic Bioconductor annotation PACKAGES file, default: 900")
+    parser.add_argument("--sample", type=int, default=100,
+                        help="number of pkgs with a tarball whose DESCRIPTION is parsed, default: 100")
+    parser.add_argument("--depth", type=int, default=24,
+                        help="depth of the chain and diamond dependency graphs, default: 24")
+    parser.add_argument("--width", type=int, default=48,
+                        help="number of leaves of the star dependency graph, default: 48")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="number of timed runs per stage, default: 3")
+    parser.add_argument("--output", type=str,
+                        default=osp.join(osp.dirname(osp.abspath(__file__)), "results.jsonl"),
+                        help="JSONL file the results are appended to, default: benchmarks/results.jsonl")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+    # resolved before leaving cwd, a relative path would end up in workdir and be removed with it
+    args.output = osp.abspath(args.output)
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="bench-generator-")
+    # PKGBUILDGenerator keeps no tarball in cwd with clean=True, but stay out of the repo anyway
+    os.chdir(workdir)
+    try:
+        start = time.perf_counter()
+        mirror = Mirror(osp.join(workdir, "mirror"), args.cran, args.bioc, args.annotation,
+                        args.sample, args.depth, args.width)
+        print(f"mirror of {args.cran} + {args.bioc} + {args.annotation} pkgs built in "
+              f"{time.perf_counter() - start:.1f} s")
+        with mirror:
+            results = run_benchmarks(mirror, workdir, args.repeat)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{'stage':<44} {'ops':>6} {'best s':>9} {'median s':>9} {'us/op':>10} {'peak MB':>8}")
+    for result in results:
+        print(f"{result['stage']:<44} {result['ops']:>6} {result['best_s']:>9.3f} {result['median_s']:>9.3f} "
+              f"{result['per_op_us']:>10.1f} {result['peak_bytes'] / 1024 ** 2:>8.1f}")
+    run = {
+        "time": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": {_: getattr(args, _) for _ in ["cran", "bioc", "annotation", "sample", "depth", "width", "repeat"]},
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "results": results
+    }
+    with open(args.output, 'a') as f:
+        f.write(json.dumps(run) + '\n')
+    print(f"results appended to {args.output}")
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+benchmark writing lilac.yaml: `yaml.safe_dump` + `prettier -w` (the old path) against the in-process dump_yaml
+the old path is only timed if prettier is installed, in which case the outputs are also checked to be byte-identical
+"""
+import argparse
+import os.path as osp
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+sys.path.insert(0, osp.dirname(osp.dirname(osp.abspath(__file__))))
+from PKGBUILDGenerator.yaml_writer import dump_yaml  # noqa: E402
+
+
+def lilac_dicts(n):
+    for i in range(n):
+        yaml_dict = {
+            "maintainers": [{"github": "maintainer"}],
+            "build_prefix": "extra-x86_64",
+            "update_on": [{
+                "source": "regex",
+                "regex": f'pkg{i}_([\\d._-]+).tar.gz',
+                "url": f"https://cran.r-project.org/package=pkg{i}"
+            }],
+            "repo_depends": [f"r-dep{_}" for _ in range(i % 7)]
+        }
+        if i % 5 == 0:
+            yaml_dict["update_on"] = [{
+                "source": "github",
+                "github": f"owner/pkg{i}",
+                "use_latest_release": True}]
+        if not yaml_dict["repo_depends"]:
+            del yaml_dict["repo_depends"]
+        yield yaml_dict
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=50,
+                        help="number of lilac.yaml files to write, default: 50")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+    prettier = shutil.which("prettier")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        start = time.perf_counter()
+        for i, yaml_dict in enumerate(lilac_dicts(args.n)):
+            with open(osp.join(tmpdir, f"{i}.new.yaml"), "w", newline='\n') as f:
+                f.write(dump_yaml(yaml_dict))
+        new_elapsed = time.perf_counter() - start
+        print(f"dump_yaml:              {new_elapsed / args.n * 1000:8.3f} ms/file")
+
+        start = time.perf_counter()
+        for i, yaml_dict in enumerate(lilac_dicts(args.n)):
+            filename = osp.join(tmpdir, f"{i}.old.yaml")
+            with open(filename, "w", newline='\n') as f:
+                yaml.safe_dump(yaml_dict, f)
+            if prettier:
+                subprocess.run([prettier, "-w", filename],
+                               stdout=subprocess.DEVNULL, check=True)
+        old_elapsed = time.perf_counter() - start
+        if not prettier:
+            print(f"yaml.safe_dump:         {old_elapsed / args.n * 1000:8.3f} ms/file (prettier not found, not included)")
+            sys.exit(0)
+        print(f"safe_dump + prettier:   {old_elapsed / args.n * 1000:8.3f} ms/file")
+        mismatches = []
+        for i in range(args.n):
+            with open(osp.join(tmpdir, f"{i}.new.yaml"), "rb") as f1, open(osp.join(tmpdir, f"{i}.old.yaml"), "rb") as f2:
+                if f1.read() != f2.read():
+                    mismatches.append(i)
+        if mismatches:
+            print(f"outputs differ for {len(mismatches)} files, e.g. #{mismatches[0]}")
+            sys.exit(1)
+        print("outputs are byte-identical")
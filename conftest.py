@@ -0,0 +1 @@
+# lets `pytest` import PKGBUILDGenerator from the repo root, pytest puts the dir of this file on sys.path
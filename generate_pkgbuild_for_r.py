@@ -1,13 +1,15 @@
 #!/usr/bin/env python3
 import argparse
-
-from PKGBUILDGenerator.PKGBUILDGenerator import PKGBUILDGenerator
+import atexit
+import os
+import os.path as osp
+import sys
 
 
 def get_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("--rpkgnames", type=str, nargs='+',
-                        help="r pkgnames in CRAN or Bioconductor")
+                        help="r pkgnames in CRAN or Bioconductor, case-insensitive, ArchLinux pkgnames like r-foo are also accepted")
     parser.add_argument("--repo", type=str, choices=["cran", "bioconductor", "github"], default="cran",
                         help="repo to use, default: cran")
     parser.add_argument("--destdir", default='.',
@@ -17,7 +19,7 @@ def get_args():
     parser.add_argument("--email", type=str,
                         help="email of maintainer in PKGBUILD")
     parser.add_argument("--clean", action="store_true",
-                        help="clean temporaly files")
+                        help="do not keep source tarballs in cwd")
     parser.add_argument("--recursive", action="store_true",
                         help="create also the PKGBUILD for deps")
     parser.add_argument("--verbose", action="store_true",
@@ -25,35 +27,218 @@ def get_args():
     parser.add_argument("--skip", action="store_true",
                         help="skip PKGBUILD generator if the PKGBUILD exists")
     parser.add_argument("--updpkgsums", action="store_true",
-                        help="run updatepkgsums to update source checksums")
-    parser.add_argument("--cran-mirror", type=str, default="https://mirrors.ustc.edu.cn/CRAN",
-                        help="CRAN mirror, default: https://mirrors.ustc.edu.cn/CRAN")
-    parser.add_argument("--bioconductor-mirror", type=str, default="https://mirrors.ustc.edu.cn/bioc/",
-                        help="Bioconductor mirror, default: https://mirrors.ustc.edu.cn/bioc/")
+                        help="run updpkgsums to verify source checksums, which are computed from the downloaded tarballs anyway")
+    parser.add_argument("--cran-mirror", type=str, nargs='+', default=["https://mirrors.ustc.edu.cn/CRAN", "https://cloud.r-project.org"],
+                        help="CRAN mirrors, the fastest healthy one is used, others are raced when it's slow or tried when it fails, "
+                        "default: https://mirrors.ustc.edu.cn/CRAN https://cloud.r-project.org")
+    parser.add_argument("--bioconductor-mirror", type=str, nargs='+', default=["https://mirrors.ustc.edu.cn/bioc/", "https://bioconductor.org"],
+                        help="Bioconductor mirrors, see --cran-mirror, default: https://mirrors.ustc.edu.cn/bioc/ https://bioconductor.org")
+    parser.add_argument("--hedge-delay", type=float, default=1.0,
+                        help="seconds to wait for a mirror before racing the next one, default: 1.0")
+    parser.add_argument("--github-api", type=str, default="https://api.github.com",
+                        help="github API to look up releases of github pkgs, default: https://api.github.com")
+    parser.add_argument("--github-token", type=str, default=os.environ.get("GITHUB_TOKEN"),
+                        help="github token for release lookups, default: $GITHUB_TOKEN")
     parser.add_argument("--maintainer-github", type=str,
                         help="github username of PKGBUILD maintainer, only used in `lilac.yaml`")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of pkgs to fetch and generate in parallel, default: 1")
+    parser.add_argument("--max-connections-per-host", type=int, default=4,
+                        help="max number of concurrent downloads from one mirror, default: 4")
+    parser.add_argument("--plan", action="store_true",
+                        help="print the build plan of --rpkgnames and their deps from the PACKAGES indexes, without fetching tarballs")
+    parser.add_argument("--rdepends", type=str, nargs='+',
+                        help="print the pkgs in destdir to rebuild, in build order, when these pkgs change")
+    parser.add_argument("--update", action="store_true",
+                        help="regenerate only the PKGBUILDs in destdir whose upstream version changed")
+    parser.add_argument("--all", action="store_true",
+                        help="generate PKGBUILDs of all pkgs in CRAN and Bioconductor instead of --rpkgnames, resuming an interrupted run")
+    parser.add_argument("--export", type=str, metavar="FILE",
+                        help="export parsed metadata of all pkgs in CRAN and Bioconductor to this JSONL file instead of generating PKGBUILDs, "
+                        "pkgs whose version did not change since the earlier export in it are not parsed again, "
+                        "pkgs are selected like in --all mode")
+    parser.add_argument("--export-columns", type=str, metavar="FILE",
+                        help="also write the exported metadata to this columnar file, for fast reloading")
+    parser.add_argument("--export-metadata-only", action="store_true",
+                        help="export from the PACKAGES indexes only, without fetching tarballs, "
+                        "title, systemrequirements, fortran and sha256sum are then null")
+    parser.add_argument("--bulk-repos", type=str, nargs='+', choices=["cran", "bioconductor"], default=["cran", "bioconductor"],
+                        help="repos to generate all pkgs from in --all and --export mode, default: cran bioconductor")
+    parser.add_argument("--include", type=str,
+                        help="only generate pkgs whose name matches this regex in --all and --export mode")
+    parser.add_argument("--exclude", type=str,
+                        help="do not generate pkgs whose name matches this regex in --all and --export mode")
+    parser.add_argument("--journal", type=str,
+                        help="checkpoint journal of --all mode, default: DESTDIR/.pkgbuild-journal.jsonl")
+    parser.add_argument("--cache-dir", type=str,
+                        help="cache dir for PACKAGES files, default: $XDG_CACHE_HOME/pkgbuild-generator-for-r")
+    parser.add_argument("--cache-ttl", type=int, default=0,
+                        help="seconds to use cached PACKAGES files without revalidating them, default: 0")
+    parser.add_argument("--tarball-cache-size", type=int, default=2048,
+                        help="max size of source tarballs cached in cache dir in MiB, 0 to disable, default: 2048")
+    parser.add_argument("--offline", action="store_true",
+                        help="use cached PACKAGES files only, never fetch them from mirrors")
+    parser.add_argument("--serve", type=str, metavar="ADDRESS",
+                        help="keep the generator warm and serve requests on unix:/path/to/socket or host:port, see --server")
+    parser.add_argument("--refresh-interval", type=int, default=3600,
+                        help="seconds between reloads of the PACKAGES indexes in --serve mode, 0 to never reload, default: 3600")
+    parser.add_argument("--server", type=str, metavar="ADDRESS",
+                        help="send the request to a generator started with --serve instead of running it here, "
+                        "the mirror and cache options of the server apply")
+    parser.add_argument("--profile", type=str,
+                        help="record per-stage timers and byte counters, write them to this file as a Chrome trace, "
+                        "or as a JSONL event log if it ends with .jsonl, and print a summary at exit")
+
+    args = parser.parse_args()
+    if args.server and (args.all or args.plan or args.profile or args.serve or args.export):
+        parser.error("--server does not support --all, --plan, --profile, --serve and --export")
+    if args.export_columns and not args.export:
+        parser.error("--export-columns needs --export")
+    return args
+
+
+def write_profile(profiler, filename):
+    profiler.write(filename)
+    print(profiler.summary())
+    print(f"profile written to {filename}")
+
 
-    return parser.parse_args()
+def print_write_summary(gen, args):
+    # the counters live in the server process in --server mode
+    if not args.server:
+        print(f"{gen.files_written} files written, {gen.files_unchanged} unchanged")
 
 
 if __name__ == '__main__':
     args = get_args()
-    gen = PKGBUILDGenerator(
-        cran_mirror=args.cran_mirror,
-        bioconductor_mirror=args.bioconductor_mirror
-    )
-    for rpkgname in args.rpkgnames:
-        gen.generate_pkgbuild(
-            rpkgname=rpkgname,
+    if args.server:
+        # the client needs neither requests nor the indexes, so it starts fast
+        from PKGBUILDGenerator.client import RemoteGenerator
+        gen = RemoteGenerator(args.server)
+        # paths are resolved by the server, which may run in another dir
+        args.destdir = osp.abspath(args.destdir)
+    else:
+        from PKGBUILDGenerator.PKGBUILDGenerator import PKGBUILDGenerator
+        from PKGBUILDGenerator.bulk import generate_bulk
+        from PKGBUILDGenerator.export import export_metadata
+        from PKGBUILDGenerator.profiler import Profiler
+        gen = PKGBUILDGenerator(
+            cran_mirror=args.cran_mirror,
+            bioconductor_mirror=args.bioconductor_mirror,
+            cache_dir=args.cache_dir,
+            cache_ttl=args.cache_ttl,
+            offline=args.offline,
+            max_connections_per_host=args.max_connections_per_host,
+            tarball_cache_size=args.tarball_cache_size * 1024 ** 2,
+            profiler=Profiler() if args.profile else None,
+            hedge_delay=args.hedge_delay,
+            github_api=args.github_api,
+            github_token=args.github_token
+        )
+    if args.serve:
+        from PKGBUILDGenerator.server import serve
+        serve(gen, args.serve, refresh_interval=args.refresh_interval, verbose=args.verbose)
+        sys.exit(0)
+    if args.profile:
+        # written at exit, so every mode below gets it however it ends
+        atexit.register(write_profile, gen.profiler, args.profile)
+    if args.rdepends:
+        plan = gen.rebuild_plan(
+            rpkgnames=[gen.get_rpkgname(name=_) for _ in args.rdepends], destdir=args.destdir)
+        for i, wave in enumerate(plan):
+            print(f"wave {i}: {' '.join(wave)}")
+        sys.exit(0)
+    if args.plan:
+        roots = [(rpkgname if args.repo == "github" else gen.get_rpkgname(rpkgname), args.repo)
+                 for rpkgname in args.rpkgnames]
+        plan, _, failures = gen.resolve_dependency_graph(
+            roots, skip=args.skip, destdir=args.destdir, jobs=args.jobs, metadata_only=True)
+        for i, wave in enumerate(plan):
+            print(f"wave {i}: {' '.join(wave)}")
+        for rpkgname, error in failures.items():
+            print(f"Failed to resolve pkg: {rpkgname}: {error}")
+        sys.exit(1 if failures else 0)
+    if args.update:
+        stale, failures = gen.update_pkgbuilds(
             maintainer_github=args.maintainer_github,
             maintainer=args.maintainer,
             email=args.email,
-            recursive=args.recursive,
             verbose=args.verbose,
             updpkgsums=args.updpkgsums,
-            repo=args.repo,
-            skip=args.skip,
+            clean=args.clean,
             destdir=args.destdir,
-            clean=args.clean
+            jobs=args.jobs
+        )
+        for info in stale:
+            print(f"{info['rpkgname']}: {info['rpkgver']} -> {info['new_rpkgver']}")
+        print(f"{len(stale)} pkgs updated")
+        print_write_summary(gen, args)
+        for rpkgname, error in failures.items():
+            print(f"Failed to update PKGBUILD for pkg: {rpkgname}: {error}")
+        if failures:
+            sys.exit(1)
+        print("Done")
+        sys.exit(0)
+    if args.export:
+        failures = export_metadata(
+            gen,
+            args.export,
+            columns_filename=args.export_columns,
+            repos=args.bulk_repos,
+            regex=args.include,
+            exclude_regex=args.exclude,
+            metadata_only=args.export_metadata_only,
+            verbose=args.verbose,
+            clean=args.clean,
+            jobs=args.jobs
         )
+        for (rpkgname, repo), error in failures.items():
+            print(f"Failed to export pkg: {rpkgname} ({repo}): {error}")
+        if failures:
+            sys.exit(1)
+        print("Done")
+        sys.exit(0)
+    if args.all:
+        failures = generate_bulk(
+            gen,
+            maintainer_github=args.maintainer_github,
+            journal_filename=args.journal or osp.join(
+                args.destdir, ".pkgbuild-journal.jsonl"),
+            repos=args.bulk_repos,
+            regex=args.include,
+            exclude_regex=args.exclude,
+            maintainer=args.maintainer,
+            email=args.email,
+            verbose=args.verbose,
+            updpkgsums=args.updpkgsums,
+            clean=args.clean,
+            destdir=args.destdir,
+            jobs=args.jobs
+        )
+        print_write_summary(gen, args)
+        for (rpkgname, repo), error in failures.items():
+            print(f"Failed to generate PKGBUILD for pkg: {rpkgname} ({repo}): {error}")
+        if failures:
+            sys.exit(1)
+        print("Done")
+        sys.exit(0)
+    failures = gen.generate_pkgbuilds(
+        rpkgnames=args.rpkgnames,
+        maintainer_github=args.maintainer_github,
+        maintainer=args.maintainer,
+        email=args.email,
+        recursive=args.recursive,
+        verbose=args.verbose,
+        updpkgsums=args.updpkgsums,
+        repo=args.repo,
+        skip=args.skip,
+        destdir=args.destdir,
+        clean=args.clean,
+        jobs=args.jobs
+    )
+    print_write_summary(gen, args)
+    for rpkgname, error in failures.items():
+        print(f"Failed to generate PKGBUILD for pkg: {rpkgname}: {error}")
+    if failures:
+        sys.exit(1)
     print("Done")
@@ -0,0 +1,49 @@
+import gzip
+
+import pytest
+
+from PKGBUILDGenerator.cache import MetadataCache
+
+PACKAGES = b"Package: foo\nVersion: 1.0\n"
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, content=b""):
+        self.status_code = status_code
+        self.reason = "Error" if status_code >= 400 else "OK"
+        self.content = content
+        self.headers = {}
+
+
+class FakeSession(object):
+    def __init__(self, responses):
+        """
+        session answering GETs of url with `responses[url]`
+        """
+        self.responses = responses
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        return self.responses[url]
+
+
+@pytest.mark.parametrize("gz_response", [
+    FakeResponse(503),
+    FakeResponse(200, gzip.compress(PACKAGES)[:20]),
+    FakeResponse(200, b"\x1f\x8bnot gzip")
+])
+def test_fetch_packages_falls_back_to_plain_packages(tmp_path, gz_response):
+    url = "http://mirror.invalid/src/contrib/PACKAGES"
+    session = FakeSession({f"{url}.gz": gz_response, url: FakeResponse(200, PACKAGES)})
+    cache = MetadataCache(cache_dir=str(tmp_path), session=session)
+    assert cache.fetch_packages(url) == PACKAGES.decode()
+    assert session.urls == [f"{url}.gz", url]
+
+
+def test_fetch_packages_raises_last_error(tmp_path):
+    url = "http://mirror.invalid/src/contrib/PACKAGES"
+    session = FakeSession({f"{url}.gz": FakeResponse(503), url: FakeResponse(502)})
+    cache = MetadataCache(cache_dir=str(tmp_path), session=session)
+    with pytest.raises(RuntimeError, match="502"):
+        cache.fetch_packages(url)
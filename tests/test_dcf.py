@@ -0,0 +1,50 @@
+import configparser
+import random
+
+from PKGBUILDGenerator.dcf import parse_dcf, parse_dcf_record
+
+FIELD_NAMES = ["Package", "Version", "Depends", "Imports", "LinkingTo", "Suggests", "License", "Title",
+               "Description", "SystemRequirements", "NeedsCompilation", "Encoding"]
+WORDS = ["foo", "bar (>= 1.0)", "R (>= 3.5.0)", "100%", "%(x)s", "C++17", "GNU make", "a: b", "x;y", "=", "  "]
+
+
+def random_record(rng, name):
+    lines = [f"Package: {name}"]
+    for key in rng.sample(FIELD_NAMES[1:], rng.randint(1, len(FIELD_NAMES) - 1)):
+        lines.append(f"{key}: {', '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).strip()}x")
+        for _ in range(rng.choice([0, 0, 1, 3])):
+            lines.append(rng.choice([" ", "\t", "        "]) + rng.choice(WORDS).strip() + "y")
+    return '\n'.join(lines)
+
+
+def parse_configparser(text):
+    """
+    the configparser based parsing parse_dcf replaced, fields are lowercased by configparser
+    """
+    records = {}
+    for desc in text.split('\n\n'):
+        name = desc.split('\n', 1)[0][len("Package: "):].strip()
+        config = configparser.ConfigParser(interpolation=None)
+        config.read_string(f"[{name}]\n" + desc)
+        records[name] = dict(config[name])
+    return records
+
+
+def test_parse_dcf_matches_configparser():
+    rng = random.Random(0)
+    text = '\n\n'.join(random_record(rng, f"pkg{i}") for i in range(2000)) + '\n'
+    expected = parse_configparser(text.rstrip('\n'))
+    records = list(parse_dcf(text))
+    assert len(records) == len(expected)
+    for record in records:
+        assert {key.lower(): value for key, value in record.fields.items()} == expected[record.name]
+
+
+def test_dependencies():
+    record = parse_dcf_record(
+        "Package: p\nImports: foo (>= 1.0),\n    bar, baz(< 2)\nLinkingTo: Rcpp\n\nSuggests: knitr\n")
+    assert record.imports == [("foo", ">= 1.0"), ("bar", None), ("baz", "< 2")]
+    assert record.linkingto == [("Rcpp", None)]
+    # stray blank lines do not end a DESCRIPTION
+    assert record.suggests == [("knitr", None)]
+    assert record["Imports"] == "foo (>= 1.0),\nbar, baz(< 2)"
@@ -0,0 +1,103 @@
+import asyncio
+import os
+
+import pytest
+
+from PKGBUILDGenerator.aio import AsyncPKGBUILDGenerator
+from PKGBUILDGenerator.PKGBUILDGenerator import PKGBUILDGenerator
+
+DEPENDS = {"a": [], "b": [], "c": ["a", "b"], "d": ["c"]}
+
+
+def make_generator(tmp_path, monkeypatch, depends, broken):
+    """
+    return a generator planning the pkgs of `depends`, rpkgname -> r_depends, whose PKGBUILDs of `broken` fail to render
+    """
+    gen = PKGBUILDGenerator(cran_mirror="http://mirror.invalid", cache_dir=str(tmp_path / "cache"), session=object())
+    desc_dicts = {name: {"rpkgname": name, "r_depends": deps, "complete": True} for name, deps in depends.items()}
+    plan = [["a", "b"], ["c"], ["d"]]
+
+    def render_pkgbuild(desc_dict):
+        if desc_dict["rpkgname"] in broken:
+            raise RuntimeError(f"cannot render {desc_dict['rpkgname']}")
+        return ""
+
+    monkeypatch.setattr(gen, "resolve_dependency_graph", lambda roots, **kwargs: (plan, desc_dicts, {}))
+    monkeypatch.setattr(gen, "render_pkgbuild", render_pkgbuild)
+    monkeypatch.setattr(gen, "render_lilac_yaml", lambda desc_dict: "")
+    monkeypatch.setattr(gen, "render_lilac_py", lambda desc_dict: "")
+    return gen
+
+
+def check_failures(failures, destdir):
+    assert sorted(os.listdir(destdir)) == ["r-b"]
+    assert sorted(failures) == ["a", "c", "d"]
+    assert str(failures["c"]) == "not generated as its deps failed: a"
+    assert str(failures["d"]) == "not generated as its deps failed: c"
+
+
+def test_dependents_of_failed_pkg_are_not_generated(tmp_path, monkeypatch, capsys):
+    gen = make_generator(tmp_path, monkeypatch, DEPENDS, broken=["a"])
+    destdir = tmp_path / "out"
+    failures = gen.generate_pkgbuilds(["d"], "me", recursive=True, verbose=True, repo="github", destdir=str(destdir))
+    check_failures(failures, destdir)
+    # pkgs are announced before they are written
+    assert capsys.readouterr().out.splitlines() == [
+        "generating PKGBUILD for pkg: a", "generating PKGBUILD for pkg: b"]
+    with pytest.raises(RuntimeError, match="cannot render a"):
+        gen.generate_pkgbuild("d", "me", recursive=True, repo="github", destdir=str(destdir))
+
+
+def test_async_generator_plans_like_sync_one(tmp_path, monkeypatch):
+    gen = make_generator(tmp_path, monkeypatch, DEPENDS, broken=["a"])
+    destdir = tmp_path / "out"
+    failures = asyncio.run(AsyncPKGBUILDGenerator(gen).generate_pkgbuilds(
+        ["d"], "me", recursive=True, repo="github", destdir=str(destdir)))
+    check_failures(failures, destdir)
+
+
+def test_plan_waves(tmp_path):
+    gen = PKGBUILDGenerator(cran_mirror="http://mirror.invalid", cache_dir=str(tmp_path), session=object())
+    # a diamond, d needs b and c, which both need a
+    assert gen.plan_waves({"d": ["b", "c"], "c": ["a"], "b": ["a"], "a": []}) == [["a"], ["b", "c"], ["d"]]
+    # a pkg waits for its deepest dep
+    assert gen.plan_waves({"e": ["a", "d"], "d": ["b", "c"], "c": ["a"], "b": ["a"], "a": []}) == [
+        ["a"], ["b", "c"], ["d"], ["e"]]
+    # deps missing from the keys, e.g. ones that are skipped, are ignored
+    assert gen.plan_waves({"b": ["a", "missing"], "a": ["R", "methods"]}) == [["a"], ["b"]]
+    assert gen.plan_waves({}) == []
+
+
+def test_plan_waves_cycle(tmp_path):
+    gen = PKGBUILDGenerator(cran_mirror="http://mirror.invalid", cache_dir=str(tmp_path), session=object())
+    # pkgs depending on the cycle can not be planned either
+    with pytest.raises(RuntimeError, match=r"dependency cycle found among 4 pkgs: \['b', 'c', 'd', 'e'\]"):
+        gen.plan_waves({"a": [], "b": ["a", "d"], "c": ["b"], "d": ["c"], "e": ["d"]})
+    with pytest.raises(RuntimeError, match="dependency cycle"):
+        gen.plan_waves({"a": ["a"]})
+
+
+def test_updpkgsums_leaves_pkgbuild_alone(tmp_path, monkeypatch):
+    gen = make_generator(tmp_path, monkeypatch, DEPENDS, broken=[])
+    monkeypatch.setattr(gen, "render_pkgbuild", lambda desc_dict: "sha256sums=('abc')\n")
+    bindir = tmp_path / "bin"
+    bindir.mkdir()
+    updpkgsums = bindir / "updpkgsums"
+    # rewrites the file it's given, like the real one, with the checksum in $SHA256
+    updpkgsums.write_text("#!/bin/sh\nprintf \"sha256sums=('%s')\\n\" \"$SHA256\" > \"$1\"\n")
+    updpkgsums.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bindir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("SHA256", "abc")
+    destdir = tmp_path / "out"
+    desc_dict = {"rpkgname": "a", "r_depends": [], "complete": True}
+    gen.write_package(desc_dict, "me", updpkgsums=True, destdir=str(destdir))
+    pkgbuild = destdir / "r-a" / "PKGBUILD"
+    mtime = os.stat(pkgbuild).st_mtime_ns
+    os.utime(pkgbuild, ns=(mtime - 10 ** 9, mtime - 10 ** 9))
+    gen.write_package(desc_dict, "me", updpkgsums=True, destdir=str(destdir))
+    assert os.stat(pkgbuild).st_mtime_ns == mtime - 10 ** 9
+    monkeypatch.setenv("SHA256", "def")
+    with pytest.raises(RuntimeError, match="updpkgsums changed the checksums"):
+        gen.write_package(desc_dict, "me", updpkgsums=True, destdir=str(destdir))
+    assert pkgbuild.read_text() == "sha256sums=('abc')\n"
+    assert sorted(os.listdir(destdir / "r-a")) == ["PKGBUILD", "lilac.py", "lilac.yaml"]
@@ -0,0 +1,80 @@
+import hashlib
+import json
+
+import pytest
+
+from PKGBUILDGenerator.PKGBUILDGenerator import PKGBUILDGenerator
+
+GITHUB_API = "http://github-api.invalid"
+RELEASE_URL = f"{GITHUB_API}/repos/owner/foo/releases/latest"
+
+
+def etag(release):
+    return f'"{hashlib.sha256(json.dumps(release).encode("utf-8")).hexdigest()}"'
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code = status_code
+        self.reason = "Error" if status_code >= 400 else "OK"
+        self.content = content
+        self.headers = headers or {}
+
+
+class FakeGithub(object):
+    def __init__(self, releases):
+        """
+        session answering like the github API, `releases[url]` is the latest release at `url`
+        """
+        self.releases = releases
+        self.requests = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.requests.append((url, dict(headers or {})))
+        if url not in self.releases:
+            return FakeResponse(404, b'{"message": "Not Found"}')
+        if (headers or {}).get("If-None-Match") == etag(self.releases[url]):
+            return FakeResponse(304)
+        return FakeResponse(200, json.dumps(self.releases[url]).encode("utf-8"), {"ETag": etag(self.releases[url])})
+
+
+def make_generator(tmp_path, session, **kwargs):
+    return PKGBUILDGenerator(
+        cran_mirror="http://mirror.invalid", cache_dir=str(tmp_path), session=session, github_api=GITHUB_API, **kwargs)
+
+
+def test_release_is_revalidated_with_etag(tmp_path):
+    session = FakeGithub({RELEASE_URL: {"tag_name": "v1.0", "name": "1.0"}})
+    gen = make_generator(tmp_path, session, github_token="secret")
+    assert gen.get_github_ver("owner", "foo") == "1.0"
+    assert gen.get_github_ver("owner", "foo") == "1.0"
+    (_, first), (_, second) = session.requests
+    assert "If-None-Match" not in first
+    assert second["If-None-Match"] == etag(session.releases[RELEASE_URL])
+    assert first["Authorization"] == second["Authorization"] == "Bearer secret"
+    # a new release is picked up on the next revalidation
+    session.releases[RELEASE_URL] = {"tag_name": "v2.0", "name": ""}
+    assert gen.get_github_ver("owner", "foo") == "v2.0"
+
+
+def test_no_token_no_authorization(tmp_path):
+    session = FakeGithub({RELEASE_URL: {"tag_name": "v1.0"}})
+    make_generator(tmp_path, session).get_github_ver("owner", "foo")
+    assert "Authorization" not in session.requests[0][1]
+
+
+def test_repo_without_release(tmp_path):
+    gen = make_generator(tmp_path, FakeGithub({}))
+    with pytest.raises(RuntimeError, match="no release found"):
+        gen.get_github_ver("owner", "foo")
+
+
+def test_offline_release_not_cached(tmp_path):
+    session = FakeGithub({RELEASE_URL: {"tag_name": "v1.0"}})
+    gen = make_generator(tmp_path, session, offline=True)
+    with pytest.raises(RuntimeError, match="offline mode"):
+        gen.get_github_ver("owner", "foo")
+    assert session.requests == []
+    # a release cached by an earlier online run is used
+    make_generator(tmp_path, session).get_github_ver("owner", "foo")
+    assert make_generator(tmp_path, session, offline=True).get_github_ver("owner", "foo") == "v1.0"
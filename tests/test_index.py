@@ -0,0 +1,76 @@
+import os
+
+from PKGBUILDGenerator.dcf import parse_dcf
+from PKGBUILDGenerator.index import MmapPackagesIndex, PackagesIndex
+
+PACKAGES = (
+    "Package: foo\nVersion: 1.0\nImports: bar\n\n"
+    "Package: Bar\nVersion: 2.0\n  \n"
+    # a duplicate, the first entry wins
+    "Package: foo\nVersion: 9.9\n\n"
+    "Package: bar\nVersion: 3.0\n \t\n\n"
+    "Package: BAR\nVersion: 4.0\n\r\n"
+    "Package: Rcpp\nVersion: 1.0.12\nLinkingTo: \n"
+)
+NAMES = ["foo", "Bar", "bar", "BAR", "Rcpp", "rcpp", "RCPP", "FOO", "baz", "r-foo", ""]
+
+
+def write_packages(tmp_path, text, newline="\n"):
+    filename = tmp_path / "PACKAGES"
+    with open(filename, "w", newline=newline) as f:
+        f.write(text)
+    return str(filename)
+
+
+def check_same(index, expected):
+    assert sorted(index) == sorted(expected)
+    assert len(index) == len(expected)
+    for name in NAMES:
+        assert (name in index) == (name in expected), name
+        assert index.resolve_name(name) == expected.resolve_name(name), name
+        for ignore_case in [False, True]:
+            record, expected_record = index.get(name, ignore_case=ignore_case), expected.get(name, ignore_case=ignore_case)
+            if expected_record is None:
+                assert record is None, name
+            else:
+                assert record.name == expected_record.name and record.version == expected_record.version, name
+
+
+def test_matches_packages_index(tmp_path):
+    for newline in ["\n", "\r\n"]:
+        filename = write_packages(tmp_path, PACKAGES, newline)
+        with open(filename, "rb") as f:
+            expected = PackagesIndex(parse_dcf(f.read().decode("utf-8")))
+        check_same(MmapPackagesIndex(filename), expected)
+        # and once more from the sidecar
+        sidecar = str(tmp_path / f"PACKAGES{len(newline)}.idx")
+        MmapPackagesIndex(filename, sidecar=sidecar)
+        check_same(MmapPackagesIndex(filename, sidecar=sidecar), expected)
+
+
+def test_empty_file(tmp_path):
+    index = MmapPackagesIndex(write_packages(tmp_path, ""))
+    assert len(index) == 0 and list(index) == []
+    assert index.get("foo", ignore_case=True) is None
+
+
+def test_sidecar_is_rebuilt_when_file_changes(tmp_path):
+    filename = write_packages(tmp_path, PACKAGES)
+    sidecar = str(tmp_path / "PACKAGES.idx")
+    MmapPackagesIndex(filename, sidecar=sidecar)
+    stamp = os.stat(sidecar).st_mtime_ns
+    assert MmapPackagesIndex(filename, sidecar=sidecar).get("foo").version == "1.0"
+    # loaded, not rebuilt
+    assert os.stat(sidecar).st_mtime_ns == stamp
+    # the same size, a different mtime
+    write_packages(tmp_path, PACKAGES.replace("Version: 1.0\n", "Version: 1.1\n", 1))
+    os.utime(filename, ns=(stamp + 10 ** 9, stamp + 10 ** 9))
+    index = MmapPackagesIndex(filename, sidecar=sidecar)
+    assert index.get("foo").version == "1.1"
+    write_packages(tmp_path, "Package: qux\nVersion: 0.1\n")
+    index = MmapPackagesIndex(filename, sidecar=sidecar)
+    assert list(index) == ["qux"] and "foo" not in index
+    # a broken sidecar is rebuilt too
+    with open(sidecar, "wb") as f:
+        f.write(b"PKGIDX01")
+    assert list(MmapPackagesIndex(filename, sidecar=sidecar)) == ["qux"]
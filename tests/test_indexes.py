@@ -0,0 +1,93 @@
+import pytest
+
+from PKGBUILDGenerator.PKGBUILDGenerator import PKGBUILDGenerator
+
+CRAN = "http://cran.invalid"
+BIOCONDUCTOR = "http://bioconductor.invalid"
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, content=b""):
+        self.status_code = status_code
+        self.reason = "Error" if status_code >= 400 else "OK"
+        self.content = content
+        self.headers = {}
+
+    def close(self):
+        pass
+
+
+class FakeSession(object):
+    def __init__(self, packages):
+        """
+        session serving PACKAGES files, `packages[url]` is the content of the one at `url`, or a status code
+        """
+        self.packages = packages
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        content = self.packages.get(url, 404)
+        if isinstance(content, int):
+            return FakeResponse(content)
+        return FakeResponse(200, content.encode("utf-8"))
+
+
+def packages_url(repo):
+    return {
+        "cran": f"{CRAN}/src/contrib/PACKAGES",
+        "bioc": f"{BIOCONDUCTOR}/packages/release/bioc/src/contrib/PACKAGES",
+        "annotation": f"{BIOCONDUCTOR}/packages/release/data/annotation/src/contrib/PACKAGES",
+        "experiment": f"{BIOCONDUCTOR}/packages/release/data/experiment/src/contrib/PACKAGES"
+    }[repo]
+
+
+def make_generator(tmp_path, packages):
+    """
+    return a generator whose mirrors serve `packages`, repo -> list of pkgnames, and its session
+    """
+    session = FakeSession({
+        packages_url(repo): ''.join(f"Package: {_}\nVersion: 1.0\n\n" for _ in names) for repo, names in packages.items()
+    })
+    gen = PKGBUILDGenerator(
+        cran_mirror=CRAN, bioconductor_mirror=BIOCONDUCTOR, cache_dir=str(tmp_path), session=session)
+    return gen, session
+
+
+def test_refresh_keeps_index_that_failed_to_reload(tmp_path):
+    gen, session = make_generator(tmp_path, {"cran": ["bar"], "bioc": ["Foo"]})
+    assert gen.get_bioconductor_ver("Foo") == "1.0"
+    session.packages[packages_url("bioc")] = 503
+    session.packages[packages_url("cran")] = "Package: bar\nVersion: 2.0\n"
+    with pytest.raises(RuntimeError, match="bioc"):
+        gen.refresh_indexes()
+    # CRAN is reloaded all the same, the old index of bioc is kept
+    assert gen.get_cran_ver("bar") == "2.0"
+    assert gen.get_bioconductor_ver("Foo") == "1.0"
+    assert "bioc" not in gen.index_errors
+
+
+def test_get_rpkgname_prefers_exact_match(tmp_path):
+    gen, _ = make_generator(tmp_path, {"cran": ["foo", "Rcpp"], "bioc": ["Foo"]})
+    assert gen.get_rpkgname("Foo") == "Foo"
+    assert gen.get_rpkgname("foo") == "foo"
+    assert gen.get_rpkgname("FOO") == "foo"
+    assert gen.get_rpkgname("r-rcpp") == "Rcpp"
+    with pytest.raises(RuntimeError, match="not found"):
+        gen.get_rpkgname("baz")
+
+
+def test_get_rpkgname_of_cran_pkg_loads_cran_only(tmp_path):
+    gen, _ = make_generator(tmp_path, {"cran": ["foo", "Rcpp"], "bioc": ["bar", "rcpp"]})
+    assert gen.get_rpkgname("r-foo") == "foo"
+    assert gen.get_rpkgname("r-rcpp") == "Rcpp"
+    assert list(gen.indexes) == ["cran"]
+    assert gen.get_rpkgname("r-bar") == "bar"
+
+
+def test_failures_are_keyed_by_given_names(tmp_path):
+    gen, _ = make_generator(tmp_path, {"cran": ["foo"]})
+    # the tarball of foo is not on the mirror
+    failures = gen.generate_pkgbuilds(["r-foo", "FOO", "baz"], "me", destdir=str(tmp_path / "out"))
+    assert sorted(failures) == ["FOO", "baz", "r-foo"]
+    assert "not found" in str(failures["baz"])
@@ -0,0 +1,88 @@
+import itertools
+
+from PKGBUILDGenerator.license import classify_license
+
+LICENSE_WITH_FILE = ("BSD", "MIT", "CeCILL", "EUPL", "ACM", "BSL", "CC0", "Lucent Public License", "Unlimited", "custom")
+
+
+def old_classify_license(license_field):
+    """
+    the if/elif chain classify_license replaced
+    """
+    if "LGPL" in license_field or license_field == "GNU Lesser General Public License":
+        license = "LGPL"
+    elif "AGPL" in license_field or license_field == "GNU Affero General Public License":
+        license = "AGPL"
+    elif "GNU General Public License" in license_field or "GPL" in license_field:
+        license = "GPL"
+    elif "Apache" in license_field:
+        license = "Apache"
+    elif "BSD" in license_field:
+        license = "BSD"
+    elif "Artistic" in license_field:
+        license = "Artistic2.0"
+    elif "CC BY" in license_field or license_field == "Creative Commons Attribution 4.0 International License":
+        license = "CCPL:by-nc-sa"
+    elif license_field in ["Mozilla Public License 1.1", "MPL", "MPL-1.1"]:
+        license = "MPL"
+    elif license_field in [
+        "Mozilla Public License 2.0",
+        "Mozilla Public License Version 2.0",
+        "MPL (>= 2)",
+        "MPL (== 2.0)",
+        "MPL (>= 2.0)",
+        "MPL-2.0",
+        "MPL-2.0 | file LICENSE",
+        "MPL (>= 2) | file LICENSE"
+    ]:
+        license = "MPL2"
+    elif "CPL" in license_field or license_field == "Common Public License Version 1.0":
+        license = "CPL"
+    elif "MIT" in license_field:
+        license = "MIT"
+    elif "EPL" in license_field:
+        license = "EPL"
+    elif "CeCILL" in license_field:
+        license = "CeCILL"
+    elif "EUPL" in license_field:
+        license = "EUPL"
+    elif "ACM" in license_field:
+        license = "ACM"
+    elif "BSL" in license_field:
+        license = "BSL"
+    elif "CC0" in license_field:
+        license = "CC0"
+    elif "Lucent Public License" in license_field:
+        license = "Lucent Public License"
+    elif "Unlimited" in license_field:
+        license = "Unlimited"
+    else:
+        license = "custom"
+    license_filename = None
+    if license in LICENSE_WITH_FILE:
+        if "file LICENSE" in license_field:
+            license_filename = "LICENSE"
+        if "file LICENCE" in license_field:
+            license_filename = "LICENCE"
+    return license, license_filename
+
+
+BASES = [
+    "GPL-2", "GPL-3", "GPL (>= 2)", "GNU General Public License", "LGPL-2.1", "LGPL (>= 3)",
+    "GNU Lesser General Public License", "AGPL-3", "GNU Affero General Public License", "Apache License 2.0",
+    "Apache License (== 2.0)", "BSD_2_clause", "BSD_3_clause", "Artistic-2.0", "Artistic License 2.0", "CC BY 4.0",
+    "CC BY-SA 4.0", "Creative Commons Attribution 4.0 International License", "Mozilla Public License 1.1", "MPL",
+    "MPL-1.1", "Mozilla Public License 2.0", "Mozilla Public License Version 2.0", "MPL (>= 2)", "MPL (== 2.0)",
+    "MPL (>= 2.0)", "MPL-2.0", "Common Public License Version 1.0", "CPL-1.0", "MIT", "EPL", "EPL-2.0", "CeCILL",
+    "CeCILL-2", "EUPL", "EUPL-1.2", "ACM", "BSL", "BSL-1.0", "CC0", "Lucent Public License", "Unlimited",
+    "file LICENSE", "file LICENCE", "Proprietary", "", "MIT + GPL-2", "Artistic-2.0 | BSD_3_clause"
+]
+SUFFIXES = ["", " + file LICENSE", " + file LICENCE", " | file LICENSE", " | file LICENCE", " + file LICENSE | GPL-2",
+            " | MIT + file LICENSE", " | GPL-3", " + file LICENSE + file LICENCE", " (restricts use)", " | CC0",
+            " | Unlimited", " | EPL", " | MPL", " | BSD_2_clause + file LICENSE", " | Apache License 2.0"]
+
+
+def test_classify_license_matches_old_chain():
+    fields = [base + suffix for base, suffix in itertools.product(BASES, SUFFIXES)]
+    for field in fields + ["MPL-2.0 | file LICENSE", "MPL (>= 2) | file LICENSE"]:
+        assert classify_license(field) == old_classify_license(field), field
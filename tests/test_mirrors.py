@@ -0,0 +1,101 @@
+import collections
+import io
+import math
+import threading
+import time
+import urllib.parse
+
+import requests
+
+from PKGBUILDGenerator.mirrors import MirrorGroup, MirrorPool
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, on_close=None):
+        self.status_code = status_code
+        self.raw = io.BytesIO(b"")
+        self.on_close = on_close
+
+    def close(self):
+        if self.on_close:
+            self.on_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FakeSession(object):
+    def __init__(self, delays, down=()):
+        """
+        session answering GETs after `delays[host]` seconds, hosts in `down` fail with a connection error
+        """
+        self.delays = delays
+        self.down = set(down)
+        self.lock = threading.Lock()
+        self.active = collections.Counter()
+        self.max_active = collections.Counter()
+
+    def head(self, url, **kwargs):
+        if urllib.parse.urlsplit(url).netloc in self.down:
+            raise requests.ConnectionError(url)
+        return FakeResponse(200)
+
+    def get(self, url, **kwargs):
+        host = urllib.parse.urlsplit(url).netloc
+        if host in self.down:
+            raise requests.ConnectionError(url)
+        with self.lock:
+            self.active[host] += 1
+            self.max_active[host] = max(self.max_active[host], self.active[host])
+        time.sleep(self.delays[host])
+
+        def on_close():
+            with self.lock:
+                self.active[host] -= 1
+
+        return FakeResponse(200, on_close)
+
+
+def test_hedged_requests_hold_the_semaphore_of_their_mirror():
+    session = FakeSession({"a": 0.2, "b": 0.05})
+    semaphores = collections.defaultdict(lambda: threading.BoundedSemaphore(1))
+    pool = MirrorPool(
+        session, [MirrorGroup(["http://a", "http://b"], "PACKAGES")], hedge_delay=0.01,
+        semaphore=lambda url: semaphores[urllib.parse.urlsplit(url).netloc])
+
+    def fetch():
+        with pool.get("http://a/x.tar.gz", stream=True) as r:
+            assert r.status_code == 200
+            time.sleep(0.02)
+
+    threads = [threading.Thread(target=fetch) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # requests that lost the race are closed when they arrive
+    pool.executor.shutdown(wait=True)
+    assert session.max_active["a"] <= 1
+    assert session.max_active["b"] <= 1
+    # every semaphore is released
+    for semaphore in semaphores.values():
+        assert semaphore.acquire(blocking=False)
+
+
+def test_failed_mirror_is_probed_again():
+    session = FakeSession({"a": 0, "b": 0}, down=["a"])
+    group = MirrorGroup(["http://a", "http://b"], "PACKAGES")
+    pool = MirrorPool(session, [group], retry_after=0.05)
+    with pool.get("http://a/x.tar.gz") as r:
+        assert r.status_code == 200
+    assert group.latencies["http://a"] == math.inf
+    session.down.clear()
+    time.sleep(0.1)
+    # the next request starts a probe of the failed mirror in the background
+    pool.get("http://a/x.tar.gz").close()
+    pool.executor.shutdown(wait=True)
+    assert group.latencies["http://a"] < math.inf
+    assert "http://a" not in group.failed
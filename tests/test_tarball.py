@@ -0,0 +1,97 @@
+import gzip
+import hashlib
+import io
+import os
+import tarfile
+
+from PKGBUILDGenerator.PKGBUILDGenerator import PKGBUILDGenerator
+from PKGBUILDGenerator.cache import UMASK
+from PKGBUILDGenerator.tarball import inspect_tarball
+
+
+def make_tarball(members, trailer=b""):
+    """
+    return a gzipped tarball of `members`, name -> content, with `trailer` after the end-of-archive blocks
+    """
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as f:
+        for name, content in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            f.addfile(info, io.BytesIO(content))
+    return gzip.compress(buf.getvalue() + trailer)
+
+
+class FakeResponse(object):
+    def __init__(self, data):
+        self.status_code = 200
+        self.reason = "OK"
+        self.raw = io.BytesIO(data)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FakeSession(object):
+    def __init__(self, data):
+        self.data = data
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        return FakeResponse(self.data)
+
+
+def test_manifest():
+    data = make_tarball({
+        "p/DESCRIPTION": b"Package: p\nLicense: MIT + file LICENSE\n",
+        "p/LICENCE": b"",
+        "p/configure": b"",
+        "p/src/init.c": b"",
+        "p/src/foo.f90": b"",
+        "p/src/Makevars.in": b"",
+        "p/inst/bar.cpp": b""
+    })
+    manifest = inspect_tarball(io.BytesIO(data), "p/DESCRIPTION")
+    assert manifest["languages"] == ["C", "Fortran"]
+    assert manifest["configure"] and manifest["makevars"]
+    assert manifest["license_files"] == ["LICENCE"]
+    assert manifest["description"].startswith("Package: p")
+
+
+def test_checksum_of_tarball_with_trailing_bytes(tmp_path):
+    # tarfile stops reading at the end-of-archive blocks, the bytes after them must be hashed all the same
+    data = make_tarball({"p/DESCRIPTION": b"Package: p\nVersion: 1.0\n"}, trailer=os.urandom(256 * 1024))
+    for tarball_cache_size in [0, 1024 ** 2]:
+        gen = PKGBUILDGenerator(
+            cran_mirror="http://mirror.invalid", cache_dir=str(tmp_path / str(tarball_cache_size)),
+            tarball_cache_size=tarball_cache_size, session=FakeSession(data))
+        manifest, sha256 = gen.inspect_source(
+            "http://mirror.invalid/src/contrib/p_1.0.tar.gz", "cran", "p_1.0.tar.gz", "p/DESCRIPTION", clean=True)
+        assert sha256 == hashlib.sha256(data).hexdigest()
+        assert manifest["members"] == ["p/DESCRIPTION"]
+        # manifests are only looked up for cached tarballs, they are not stored without a tarball cache
+        stored = gen.manifest_cache.lookup("cran", "p_1.0.tar.gz", sha256)
+        assert (stored is not None) == bool(tarball_cache_size)
+
+
+def test_keep_tarball_larger_than_cache(tmp_path, monkeypatch):
+    data = make_tarball({"p/DESCRIPTION": b"Package: p\nVersion: 1.0\n"}, trailer=os.urandom(64 * 1024))
+    monkeypatch.chdir(tmp_path)
+    gen = PKGBUILDGenerator(
+        cran_mirror="http://mirror.invalid", cache_dir=str(tmp_path / "cache"),
+        tarball_cache_size=1024, session=FakeSession(data))
+    gen.inspect_source(
+        "http://mirror.invalid/src/contrib/p_1.0.tar.gz", "cran", "p_1.0.tar.gz", "p/DESCRIPTION", clean=False)
+    with open("p_1.0.tar.gz", "rb") as f:
+        assert f.read() == data
+    assert os.stat("p_1.0.tar.gz").st_mode & 0o777 == 0o666 & ~UMASK
+    # the tarball just committed is not evicted, though it's larger than the cache
+    assert gen.tarball_cache.lookup("cran", "p_1.0.tar.gz") is not None
+    assert gen.tarball_cache.total_size == len(data)
@@ -0,0 +1,44 @@
+import random
+
+import yaml
+
+from PKGBUILDGenerator.yaml_writer import dump_yaml, scalar
+
+# line breaks are left out, PyYAML folds those strings where dump_yaml escapes them, see dump_yaml
+ALPHABET = (
+    "abcXYZ019 .-_:#?!&*|>'\"%@`,[]{}~=<\\/+"
+    "\t\x00\x07\x1b\x7f\xa0\xe9\xdf﻿中\U0001f600"
+)
+WORDS = ["yes", "No", "null", "~", "true", "1.0", "0x1f", "1_000", "12:30", "2024-01-01", "---", "...", ".inf", "=", "<<"]
+
+
+def random_string(rng):
+    if rng.random() < 0.2:
+        return rng.choice(WORDS) + ''.join(rng.choice(ALPHABET) for _ in range(rng.randrange(3)))
+    return ''.join(rng.choice(ALPHABET) for _ in range(rng.randrange(12)))
+
+
+def test_scalars_match_safe_dump():
+    rng = random.Random(0)
+    for _ in range(20000):
+        value = random_string(rng)
+        expected = yaml.safe_dump({"k": value})[len("k: "):-1]
+        actual = scalar(value)
+        if expected[0] == "'":
+            # prettier turns single quotes into double quotes unless that needs escapes
+            assert actual[0] in "'\"", value
+        else:
+            # plain and double-quoted scalars are kept as they are by prettier
+            assert actual == expected, value
+        assert yaml.safe_load(f"k: {actual}") == {"k": value}, value
+
+
+def test_dump_yaml_round_trip():
+    obj = {
+        "maintainers": [{"github": "me"}],
+        "update_on": [{"source": "regex", "regex": "foo_([\\d._-]+).tar.gz", "url": "https://cran.r-project.org/package=foo"}],
+        "repo_depends": ["r-bar", "r-baz"],
+        "build_prefix": "extra-x86_64",
+        "title": "h\xe9llo: yes"
+    }
+    assert yaml.safe_load(dump_yaml(obj)) == obj